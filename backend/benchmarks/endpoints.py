@@ -0,0 +1,525 @@
+"""
+Drive every trivia API route against a seeded synthetic question bank and
+report throughput, p50/p95/p99 latency and SQL statements per request.
+
+    python -m benchmarks.endpoints --questions 100000 --output results.json
+    python -m benchmarks.endpoints --database-url postgresql://localhost/bench \\
+        --questions 1000000 --wsgi --concurrency 8
+
+Without --database-url the bank is built in a temporary SQLite file. Requests
+go through the Flask test client, through a local threaded WSGI server with
+--wsgi, or through uvicorn serving flaskr.asgi with --asgi. Results are
+written as JSON so runs can be compared:
+
+    python -m benchmarks.endpoints --wsgi --concurrency 200 --output sync.json
+    python -m benchmarks.endpoints --asgi --concurrency 200 --compare sync.json
+
+Statements run by the async views do not go through SQLAlchemy's engine, so
+their query counts are reported as n/a.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+from werkzeug.serving import make_server
+
+from flaskr import create_app
+from flaskr.asgi import create_asgi_app
+from flaskr.bulk import import_questions
+from flaskr.compression import brotli
+from flaskr.scores import score_buffer
+from models import db, Question, Category
+
+SEED_BATCH_SIZE = 10000
+
+
+# ----------------------------------------------------------------------------#
+# Synthetic question bank.
+# ----------------------------------------------------------------------------#
+
+WORDS = (
+    "which what who where when capital river mountain painter novel element "
+    "planet team world cup country ocean king queen war year album film "
+    "oscar island desert language inventor empire battle composer symphony"
+).split()
+
+
+def synthetic_rows(questions, categories, rng):
+    for number in range(1, questions + 1):
+        text = " ".join(rng.choice(WORDS) for _ in range(8))
+        yield number, {
+            "question": "{} {}?".format(text.capitalize(), number),
+            "answer": "Answer {}".format(number),
+            "category": rng.choice(categories),
+            "difficulty": rng.randint(1, 5),
+        }
+
+
+def seed(questions, categories, rng):
+    db.session.add_all(
+        Category("Category {}".format(number)) for number in range(1, categories + 1)
+    )
+    db.session.commit()
+
+    category_ids = [category_id for (category_id,) in db.session.query(Category.id)]
+    report = import_questions(
+        synthetic_rows(questions, category_ids, rng), SEED_BATCH_SIZE
+    )
+    return report.inserted
+
+
+# ----------------------------------------------------------------------------#
+# SQL statement counting.
+# ----------------------------------------------------------------------------#
+
+
+class QueryCounter:
+    """Counts statements per thread and reports them in a response header.
+
+    Installed as WSGI middleware, so it runs in the thread serving the
+    request whichever driver is used.
+    """
+
+    header = "X-Bench-Query-Count"
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self._local = threading.local()
+
+    def before_cursor_execute(self, *args):
+        self._local.count = getattr(self._local, "count", 0) + 1
+
+    def __call__(self, environ, start_response):
+        self._local.count = 0
+
+        def counted_start_response(status, headers, exc_info=None):
+            headers.append((self.header, str(self._local.count)))
+            return start_response(status, headers, exc_info)
+
+        return self.wsgi_app(environ, counted_start_response)
+
+
+# ----------------------------------------------------------------------------#
+# Request drivers.
+# ----------------------------------------------------------------------------#
+
+
+def query_count(headers):
+    count = headers.get(QueryCounter.header)
+    return int(count) if count is not None else None
+
+
+def decoded(headers, data):
+    """Return (body, bytes on the wire) for a possibly compressed body."""
+    encoding = headers.get("Content-Encoding")
+    if encoding == "gzip":
+        return gzip.decompress(data), len(data)
+    if encoding == "br":
+        return brotli.decompress(data), len(data)
+    return data, len(data)
+
+
+class TestClientDriver:
+    headers = {}
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        """Return (status, SQL statements, decoded body, bytes on the wire)."""
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers=self.headers)
+        return (
+            response.status_code,
+            query_count(response.headers),
+            *decoded(response.headers, response.get_data()),
+        )
+
+    def close(self):
+        pass
+
+
+class HTTPDriver:
+    base_url = None
+    headers = {}
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = dict(self.headers)
+        if data:
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method, headers=headers
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return (
+                    response.status,
+                    query_count(response.headers),
+                    *decoded(response.headers, response.read()),
+                )
+        except urllib.error.HTTPError as error:
+            return (
+                error.code,
+                query_count(error.headers),
+                *decoded(error.headers, error.read()),
+            )
+
+
+class WSGIServerDriver(HTTPDriver):
+    def __init__(self, app):
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.base_url = "http://127.0.0.1:{}".format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class ASGIServerDriver(HTTPDriver):
+    def __init__(self, app):
+        import uvicorn
+
+        config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="error")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("uvicorn failed to start")
+            time.sleep(0.01)
+
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        self.base_url = "http://127.0.0.1:{}".format(port)
+
+    def close(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+# ----------------------------------------------------------------------------#
+# Scenarios.
+# ----------------------------------------------------------------------------#
+
+
+def scenarios(bank, rng, batch_size=50):
+    """Return (name, callable) pairs. Each callable returns (method, path,
+    body) for one request; DELETE removes questions the POST scenario made."""
+    created = bank["created"]
+    max_page = max(bank["questions"] // 10, 1)
+    terms = list(WORDS)
+
+    def create_question():
+        return (
+            "POST",
+            "/questions",
+            {
+                "question": "Benchmark question {}".format(rng.random()),
+                "answer": "Benchmark answer",
+                "category": rng.choice(bank["categories"]),
+                "difficulty": rng.randint(1, 5),
+            },
+        )
+
+    def delete_question():
+        question_id = created.pop() if created else rng.randint(1, bank["questions"])
+        return "DELETE", "/questions/{}".format(question_id), None
+
+    def create_batch():
+        return (
+            "POST",
+            "/questions/batch",
+            {"questions": [create_question()[2] for _ in range(batch_size)]},
+        )
+
+    def delete_batch():
+        ids = [
+            created.pop() if created else rng.randint(1, bank["questions"])
+            for _ in range(batch_size)
+        ]
+        return "DELETE", "/questions/batch", {"ids": ids}
+
+    return [
+        ("GET /categories", lambda: ("GET", "/categories", None)),
+        (
+            "GET /questions",
+            lambda: (
+                "GET",
+                "/questions?page={}".format(rng.randint(1, max_page)),
+                None,
+            ),
+        ),
+        (
+            "GET /questions/<category_id>",
+            lambda: (
+                "GET",
+                "/questions/{}".format(rng.choice(bank["categories"])),
+                None,
+            ),
+        ),
+        (
+            "POST /questions/search",
+            lambda: ("POST", "/questions/search", {"searchTerm": rng.choice(terms)}),
+        ),
+        (
+            "POST /quizzes",
+            lambda: (
+                "POST",
+                "/quizzes",
+                {
+                    "quiz_category": {"id": rng.choice(bank["categories"] + [0])},
+                    "previous_questions": [
+                        rng.randint(1, bank["questions"]) for _ in range(5)
+                    ],
+                },
+            ),
+        ),
+        ("POST /questions", create_question),
+        ("DELETE /questions/<question_id>", delete_question),
+        ("POST /questions/batch", create_batch),
+        ("DELETE /questions/batch", delete_batch),
+        (
+            "POST /scores",
+            lambda: (
+                "POST",
+                "/scores",
+                {
+                    "player": "benchmark",
+                    "quiz_category": {"id": rng.choice(bank["categories"] + [0])},
+                    "score": rng.randint(0, 5),
+                    "questions": 5,
+                },
+            ),
+        ),
+        (
+            "GET /leaderboards/<category_id>",
+            lambda: (
+                "GET",
+                "/leaderboards/{}".format(rng.choice(bank["categories"])),
+                None,
+            ),
+        ),
+    ]
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_scenario(driver, make_request, requests, concurrency, created):
+    samples = []
+    lock = threading.Lock()
+
+    def one(_):
+        method, path, body = make_request()
+        started = time.perf_counter()
+        status, queries, data, size = driver.request(method, path, body)
+        elapsed = time.perf_counter() - started
+
+        if method == "POST" and path == "/questions" and status == 200:
+            created.append(json.loads(data)["created"])
+        elif method == "POST" and path == "/questions/batch" and status == 200:
+            created.extend(json.loads(data)["created"])
+
+        with lock:
+            samples.append((elapsed, queries, status, size))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(sample[0] for sample in samples)
+    queries = [sample[1] for sample in samples]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample[2])] = statuses.get(str(sample[2]), 0) + 1
+
+    return {
+        "requests": len(samples),
+        "throughput_rps": len(samples) / wall if wall else None,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+        },
+        "queries_per_request": (
+            None if None in queries else sum(queries) / len(queries)
+        ),
+        "response_bytes": sum(sample[3] for sample in samples) / len(samples),
+        "status": statuses,
+    }
+
+
+def compare(results, path):
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+
+    print("\nagainst {}:".format(path))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        print(
+            "{:<34} throughput {:>6.2f}x  p50 {:>6.2f}x  p99 {:>6.2f}x".format(
+                name,
+                result["throughput_rps"] / before["throughput_rps"],
+                result["latency_ms"]["p50"] / before["latency_ms"]["p50"],
+                result["latency_ms"]["p99"] / before["latency_ms"]["p99"],
+            )
+        )
+
+
+# ----------------------------------------------------------------------------#
+# Entry point.
+# ----------------------------------------------------------------------------#
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--questions", type=int, default=10000)
+    parser.add_argument("--categories", type=int, default=6)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--no-seed", action="store_true")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--wsgi", action="store_true")
+    mode.add_argument("--asgi", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument(
+        "--accept-encoding",
+        default=None,
+        help="Accept-Encoding sent with every request, e.g. gzip or br",
+    )
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="earlier --output file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    directory = tempfile.TemporaryDirectory()
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        directory.name, "bench.db"
+    )
+
+    config = {"SQLALCHEMY_DATABASE_URI": database_url}
+    if args.asgi:
+        asgi_app = create_asgi_app(config)
+        app = asgi_app.state.flask_app
+    else:
+        app = create_app(config)
+
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seeded = seed(args.questions, args.categories, rng)
+            print(
+                "seeded {} questions in {:.1f}s".format(
+                    seeded, time.perf_counter() - started
+                )
+            )
+
+        bank = {
+            "questions": db.session.query(Question.id).count(),
+            "categories": [
+                category_id for (category_id,) in db.session.query(Category.id)
+            ],
+            "created": [],
+        }
+        app.wsgi_app = counter = QueryCounter(app.wsgi_app)
+        event.listen(db.engine, "before_cursor_execute", counter.before_cursor_execute)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    if args.asgi:
+        driver = ASGIServerDriver(asgi_app)
+    elif args.wsgi:
+        driver = WSGIServerDriver(app)
+    else:
+        driver = TestClientDriver(app)
+    if args.accept_encoding:
+        driver.headers = {"Accept-Encoding": args.accept_encoding}
+    results = {}
+
+    try:
+        for name, make_request in scenarios(bank, rng, args.batch_size):
+            results[name] = run_scenario(
+                driver,
+                make_request,
+                args.requests,
+                args.concurrency,
+                bank["created"],
+            )
+            latency = results[name]["latency_ms"]
+            queries = results[name]["queries_per_request"]
+            print(
+                "{:<34} {:>9.1f} req/s  p50 {:>7.2f}ms  p95 {:>7.2f}ms  "
+                "p99 {:>7.2f}ms  {:>5} queries  {:>8.0f} B".format(
+                    name,
+                    results[name]["throughput_rps"],
+                    latency["p50"],
+                    latency["p95"],
+                    latency["p99"],
+                    "n/a" if queries is None else "{:.1f}".format(queries),
+                    results[name]["response_bytes"],
+                )
+            )
+    finally:
+        driver.close()
+        # Write the buffered scores now: the exit hook would run after the
+        # database directory is gone.
+        with app.app_context():
+            score_buffer().flush()
+        directory.cleanup()
+
+    if args.compare:
+        compare(results, args.compare)
+
+    if args.output:
+        report = {
+            "meta": {
+                "questions": bank["questions"],
+                "categories": len(bank["categories"]),
+                "database": database_url.split(":")[0],
+                "driver": (
+                    "asgi" if args.asgi else "wsgi" if args.wsgi else "test_client"
+                ),
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "batch_size": args.batch_size,
+                "accept_encoding": args.accept_encoding,
+                "python": platform.python_version(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        print("results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare the ORM read path (Question instances + format() + stdlib JSON)
+with the lean path (column projection + format_row + fast JSON) for one
+listing page.
+
+    python -m benchmarks.serialization --questions 10000 --per-page 100
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from flaskr import create_app
+from flaskr.serialization import dumps, orjson
+from models import db, Question, Category
+
+
+def seed(questions):
+    categories = [Category(type) for type in ("Science", "Art", "History")]
+    db.session.add_all(categories)
+    db.session.commit()
+
+    db.session.execute(
+        Question.__table__.insert(),
+        [
+            {
+                "question": "Benchmark question number {}?".format(number),
+                "answer": "Answer {}".format(number),
+                "category": str(categories[number % len(categories)].id),
+                "difficulty": number % 5 + 1,
+            }
+            for number in range(questions)
+        ],
+    )
+    db.session.commit()
+
+
+def orm_page(offset, per_page):
+    selection = Question.query.order_by(Question.id).limit(per_page).offset(offset)
+    return json.dumps([question.format() for question in selection]).encode("utf-8")
+
+
+def lean_page(offset, per_page):
+    selection = (
+        db.session.query(*Question.columns())
+        .order_by(Question.id)
+        .limit(per_page)
+        .offset(offset)
+    )
+    return dumps([Question.format_row(row) for row in selection])
+
+
+def measure(read_page, pages, per_page):
+    started = time.perf_counter()
+    for page in range(pages):
+        read_page(page * per_page, per_page)
+        db.session.remove()
+    return (time.perf_counter() - started) / pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=10000)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(
+            {
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///"
+                + os.path.join(directory, "bench.db")
+            }
+        )
+        with app.app_context():
+            seed(args.questions)
+
+            orm = measure(orm_page, args.pages, args.per_page)
+            lean = measure(lean_page, args.pages, args.per_page)
+
+    print("encoder: {}".format("orjson" if orjson is not None else "json"))
+    print("orm  page: {:8.1f} us".format(orm * 1e6))
+    print("lean page: {:8.1f} us ({:.1f}x)".format(lean * 1e6, orm / lean))
+
+
+if __name__ == "__main__":
+    main()
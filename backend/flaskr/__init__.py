@@ -1,31 +1,72 @@
 # ----------------------------------------------------------------------------#
 # Imports
 # ----------------------------------------------------------------------------#
-import os, sys
-from flask import Flask, request, abort, jsonify
+import os
+from flask import Flask, Response, request, abort, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, Question
+from . import (
+    events,
+    categories,
+    quiz,
+    counts,
+    sessions,
+    search,
+    suggest,
+    bulk,
+    metrics,
+    versioning,
+    response_cache,
+    migrations,
+    replicas,
+    snapshot,
+    scores,
+    changes,
+    compression,
+)
+from .categories import category_cache, category_map, resolve_category
+from .serialization import jsonify
+from .metrics import expose_metrics
+from .versioning import conditional
+from .replicas import read_replica, replica_urls
+from .response_cache import cached
+from .counts import category_stats, question_counts
+from .quiz import (
+    ALL_CATEGORIES,
+    QUIZ_MAX_BATCH,
+    category_key,
+    choose_questions,
+    next_difficulty,
+    question_index,
+    start_difficulty,
+)
+from .sessions import QuizSession, quiz_sessions
+from .changes import CHANGE_FEED_HEARTBEAT, change_feed, stream_changes
+from .scores import leaderboards, record_score, score_buffer, validate_score
+from .search import search_questions
+from .suggest import suggest_terms
+from .bulk import (
+    BATCH_MAX_ITEMS,
+    EXPORT_BATCH_SIZE,
+    create_questions,
+    delete_questions,
+    encode_rows,
+    export_rows,
+    import_format,
+    import_questions,
+    read_rows,
+)
+from .pagination import (
+    paginate_questions,
+    cursor_arg,
+    keyset_questions,
+    page_args,
+)
 
 QUESTIONS_PER_PAGE = 10
-
-
-# ----------------------------------------------------------------------------#
-# Questions Pagination.
-# ----------------------------------------------------------------------------#
-
-
-def paginate_questions(request, selection):
-    page = request.args.get("page", 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-
-    questions = [question.format() for question in selection]
-    current_questions = questions[start:end]
-
-    return current_questions
+MAX_QUESTIONS_PER_PAGE = 100
 
 
 # ----------------------------------------------------------------------------#
@@ -36,7 +77,46 @@ def paginate_questions(request, selection):
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    app.config.from_mapping(
+        QUESTIONS_PER_PAGE=QUESTIONS_PER_PAGE,
+        MAX_QUESTIONS_PER_PAGE=MAX_QUESTIONS_PER_PAGE,
+    )
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    snapshot_path = app.config.get("SNAPSHOT_PATH", os.environ.get("SNAPSHOT_PATH"))
+    if snapshot_path:
+        return snapshot.serve(app, snapshot_path)
+
+    replica_uris = replica_urls(
+        app.config.get("DATABASE_REPLICA_URLS", os.environ.get("DATABASE_REPLICA_URLS"))
+    )
+    setup_db(
+        app,
+        app.config.get("SQLALCHEMY_DATABASE_URI", database_path),
+        pool_size=app.config.get("DATABASE_POOL_SIZE"),
+        max_overflow=app.config.get("DATABASE_MAX_OVERFLOW"),
+        pool_recycle=app.config.get("DATABASE_POOL_RECYCLE"),
+        pool_pre_ping=app.config.get("DATABASE_POOL_PRE_PING"),
+        replicas=replica_uris,
+    )
+    metrics.init_app(app)
+    events.init_app(app)
+    replicas.init_app(app, replica_uris)
+    versioning.init_app(app)
+    changes.init_app(app)
+    response_cache.init_app(app)
+    compression.init_app(app)
+    categories.init_app(app)
+    quiz.init_app(app)
+    counts.init_app(app)
+    sessions.init_app(app)
+    search.init_app(app)
+    suggest.init_app(app)
+    bulk.init_app(app)
+    migrations.init_app(app)
+    snapshot.init_app(app)
+    scores.init_app(app)
     CORS(app)
     """
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -55,6 +135,56 @@ def create_app(test_config=None):
         )
         return response
 
+    # ----------------------------------------------------------------------------#
+    # GET metrics in the Prometheus text format.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/metrics", methods=["GET"])
+    def retrieve_metrics():
+        return Response(expose_metrics(), mimetype="text/plain; version=0.0.4")
+
+    # ----------------------------------------------------------------------------#
+    # GET question and category changes, streamed or since a version.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/changes", methods=["GET"])
+    def retrieve_changes():
+        feed = change_feed()
+        since = request.args.get("since")
+
+        if since is None:
+            heartbeat = app.config.get("CHANGE_FEED_HEARTBEAT", CHANGE_FEED_HEARTBEAT)
+            return Response(
+                stream_with_context(
+                    stream_changes(
+                        feed, request.headers.get("Last-Event-ID"), heartbeat
+                    )
+                ),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        pending = feed.since(since)
+
+        if pending is None:
+            return jsonify(
+                {
+                    "success": True,
+                    "resync": True,
+                    "version": feed.version(),
+                    "changes": [],
+                }
+            )
+
+        return jsonify(
+            {
+                "success": True,
+                "resync": False,
+                "version": pending[-1][1]["version"] if pending else since,
+                "changes": [event for _, event, _ in pending],
+            }
+        )
+
     """
 
   @TODO: 
@@ -66,27 +196,42 @@ def create_app(test_config=None):
     # ----------------------------------------------------------------------------#
 
     @app.route("/categories", methods=["GET"])
+    @read_replica
+    @conditional
+    @cached("categories")
     def retrieve_categories():
-        selection = Category.query.order_by(Category.id).all()
+        formatted_categories = category_map()
 
-        categories = Category.query.all()
-
-        if len(categories) == 0:
+        if len(formatted_categories) == 0:
             abort(404)
 
-        formatted_categories = {}
-
-        for category in categories:
-            formatted_categories[category.id] = category.type
-
         return jsonify(
             {
                 "success": True,
                 "categories": formatted_categories,
-                "total_categories": len(selection),
+                "total_categories": len(formatted_categories),
             }
         )
 
+    # ----------------------------------------------------------------------------#
+    # GET category cache statistics.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/categories/cache", methods=["GET"])
+    def retrieve_category_cache_stats():
+        return jsonify({"success": True, "cache": category_cache().stats()})
+
+    # ----------------------------------------------------------------------------#
+    # GET question counts per category and difficulty.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/categories/stats", methods=["GET"])
+    @read_replica
+    @conditional
+    @cached("questions", "categories")
+    def retrieve_category_stats():
+        return jsonify({"success": True, **category_stats(category_map())})
+
     """
     
   @TODO: 
@@ -105,28 +250,35 @@ def create_app(test_config=None):
     # ----------------------------------------------------------------------------#
 
     @app.route("/questions", methods=["GET"])
+    @read_replica
+    @conditional
+    @cached("questions", "categories")
     def retrieve_questions():
+        last_id = cursor_arg(request)
+
         try:
-            questions = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, questions)
+            if last_id is None:
+                current_questions = paginate_questions(request, Question.query)
+                next_cursor = None
+            else:
+                current_questions, next_cursor = keyset_questions(
+                    request, Question.query, last_id
+                )
 
             if len(current_questions) == 0:
                 abort(404)
 
-            categories = Category.query.all()
-
-            formatted_categories = {}
-
-            for category in categories:
-                formatted_categories[category.id] = category.type
+            formatted_categories = category_map()
+            last_category = next(reversed(formatted_categories))
 
             return jsonify(
                 {
                     "success": True,
                     "questions": current_questions,
-                    "total_questions": len(Question.query.all()),
-                    "current_category": formatted_categories[category.id],
+                    "total_questions": question_counts().total(),
+                    "current_category": formatted_categories[last_category],
                     "categories": formatted_categories,
+                    "next_cursor": next_cursor,
                 }
             )
 
@@ -155,8 +307,7 @@ def create_app(test_config=None):
 
             question.delete()
 
-            questions = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, questions)
+            current_questions = paginate_questions(request, Question.query)
 
             return jsonify(
                 {
@@ -164,7 +315,7 @@ def create_app(test_config=None):
                     "deleted": question.id,
                     "message": "Successfully deleted!",
                     "questions": current_questions,
-                    "total_questions": len(Question.query.all()),
+                    "total_questions": question_counts().total(),
                 }
             )
 
@@ -194,17 +345,21 @@ def create_app(test_config=None):
         new_difficulty = request.json.get("difficulty")
         new_category = request.json.get("category")
 
+        category = resolve_category(new_category)
+
+        if category is None:
+            abort(422)
+
         try:
             question = Question(
                 question=new_question,
                 answer=new_answer,
-                category=new_category,
+                category=category,
                 difficulty=new_difficulty,
             )
             question.insert()
 
-            questions = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, questions)
+            current_questions = paginate_questions(request, Question.query)
 
             return jsonify(
                 {
@@ -212,13 +367,108 @@ def create_app(test_config=None):
                     "created": question.id,
                     "message": "Successfully created",
                     "questions": current_questions,
-                    "total_questions": len(Question.query.all()),
+                    "total_questions": question_counts().total(),
                 }
             )
 
         except:
             abort(405)
 
+    # ----------------------------------------------------------------------------#
+    # POST and DELETE batches of questions.
+    # ----------------------------------------------------------------------------#
+
+    def batch_items(key):
+        body = request.get_json(silent=True) or {}
+        items = body.get(key) if isinstance(body, dict) else None
+
+        if not isinstance(items, list) or not items:
+            abort(422)
+        if len(items) > app.config.get("BATCH_MAX_ITEMS", BATCH_MAX_ITEMS):
+            abort(422)
+
+        return items
+
+    @app.route("/questions/batch", methods=["POST"])
+    def create_question_batch():
+        items = batch_items("questions")
+
+        try:
+            results = create_questions(items)
+        except:
+            abort(422)
+
+        return jsonify(
+            {
+                "success": True,
+                "created": [result["id"] for result in results if result["success"]],
+                "failed": sum(1 for result in results if not result["success"]),
+                "results": results,
+                "total_questions": question_counts().total(),
+            }
+        )
+
+    @app.route("/questions/batch", methods=["DELETE"])
+    def delete_question_batch():
+        ids = batch_items("ids")
+
+        try:
+            results = delete_questions(ids)
+        except:
+            abort(422)
+
+        return jsonify(
+            {
+                "success": True,
+                "deleted": [result["id"] for result in results if result["success"]],
+                "failed": sum(1 for result in results if not result["success"]),
+                "results": results,
+                "total_questions": question_counts().total(),
+            }
+        )
+
+    # ----------------------------------------------------------------------------#
+    # POST bulk import of questions.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/questions/import", methods=["POST"])
+    def import_question_bank():
+        fmt = import_format(request)
+        batch_size = request.args.get("batch_size", None, type=int)
+
+        if fmt not in ("ndjson", "csv"):
+            abort(400)
+
+        report = import_questions(read_rows(request.stream, fmt), batch_size)
+
+        return jsonify(dict(report.format(), success=True))
+
+    # ----------------------------------------------------------------------------#
+    # GET streaming export of questions.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/questions/export", methods=["GET"])
+    @read_replica
+    def export_question_bank():
+        fmt = request.args.get("format", "ndjson")
+        category = request.args.get("category", None, type=int)
+        difficulty = request.args.get("difficulty", None, type=int)
+
+        if fmt not in ("ndjson", "csv"):
+            abort(400)
+
+        batch_size = app.config.get("EXPORT_BATCH_SIZE", EXPORT_BATCH_SIZE)
+        rows = export_rows(category, difficulty, batch_size)
+        mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+
+        return Response(
+            stream_with_context(encode_rows(rows, fmt, batch_size)),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": "attachment; filename=questions.{}".format(fmt)
+            },
+        )
+
     """
   @TODO: 
   Create a POST endpoint to get questions based on a search term. 
@@ -234,32 +484,47 @@ def create_app(test_config=None):
     # ----------------------------------------------------------------------------#
 
     @app.route("/questions/search", methods=["POST"])
+    @read_replica
     def search_question():
         body = request.get_json()
 
-        search = body.get("searchTerm", "")
+        search_term = body.get("searchTerm", "")
 
         try:
-            questions = Question.query.filter(
-                Question.question.ilike("%{}%".format(search))
-            ).all()
+            page, per_page = page_args(request)
+            current_questions, total_questions = search_questions(
+                search_term, page, per_page
+            )
 
-            if not questions:
+            if len(current_questions) == 0:
                 abort(404)
 
-            current_questions = paginate_questions(request, questions)
-
             return jsonify(
                 {
                     "success": True,
                     "questions": current_questions,
-                    "total_questions": len(current_questions),
+                    "total_questions": total_questions,
                 }
             )
 
         except:
             abort(404)
 
+    # ----------------------------------------------------------------------------#
+    # GET search term suggestions for a prefix.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/questions/suggest", methods=["GET"])
+    @read_replica
+    @conditional
+    def suggest_question_terms():
+        prefix = request.args.get("prefix", "").strip()
+        limit = request.args.get("limit", 10, type=int)
+
+        suggestions = suggest_terms(prefix, limit) if prefix else []
+
+        return jsonify({"success": True, "prefix": prefix, "suggestions": suggestions})
+
     """
   @TODO: 
   Create a GET endpoint to get questions based on category. 
@@ -273,14 +538,23 @@ def create_app(test_config=None):
     # ----------------------------------------------------------------------------#
 
     @app.route("/questions/<int:category_id>", methods=["GET"])
+    @read_replica
+    @conditional
+    @cached("category:{category_id}", "bank")
     def get_categories(category_id):
-        body = request.get_json()
+        last_id = cursor_arg(request)
 
         try:
 
-            questions = Question.query.filter(Question.category == str(category_id))
+            questions = Question.query.filter(Question.category == category_id)
 
-            current_questions = paginate_questions(request, questions)
+            if last_id is None:
+                current_questions = paginate_questions(request, questions)
+                next_cursor = None
+            else:
+                current_questions, next_cursor = keyset_questions(
+                    request, questions, last_id
+                )
 
             if len(current_questions) == 0:
                 abort(404)
@@ -289,8 +563,9 @@ def create_app(test_config=None):
                 {
                     "success": True,
                     "questions": current_questions,
-                    "total_questions": len(current_questions),
+                    "total_questions": question_counts().category_total(category_id),
                     "current_category": category_id,
+                    "next_cursor": next_cursor,
                 }
             )
 
@@ -313,42 +588,191 @@ def create_app(test_config=None):
     # ----------------------------------------------------------------------------#
 
     @app.route("/quizzes", methods=["POST"])
+    @read_replica
     def play_quiz():
-        body = request.get_json()
+        body = request.get_json(silent=True) or {}
+
+        if not isinstance(body, dict):
+            abort(400)
+
+        session_id = body.get("session_id")
+        session = None
+
+        if session_id is not None:
+            try:
+                session = quiz_sessions().get(session_id)
+            except TypeError:
+                abort(422)
+
+            if session is None:
+                abort(404)
+
+        try:
+
+            if session is not None:
+                category = session.category
+                excluded = session.served
+
+            else:
+                quiz_category = body.get("quiz_category", None)
+                previous_questions = body.get("previous_questions", [])
+
+                if not quiz_category:
+                    abort(422)
+
+                category = quiz_category["id"]
+                excluded = set(int(question_id) for question_id in previous_questions)
+
+            if not question_index().bucket(category):
+                abort(422)
+
+            count = min(
+                max(int(body.get("count", 1)), 1),
+                app.config.get("QUIZ_MAX_BATCH", QUIZ_MAX_BATCH),
+            )
+            difficulty = next_difficulty(body, session)
+            questions = choose_questions(category, excluded, count, difficulty)
+
+            if not questions:
+                return jsonify({"question": False, "questions": []})
+
+            if session is not None:
+                session.served.update(question["id"] for question in questions)
+                quiz_sessions().save(session)
+
+            return jsonify(
+                {
+                    "success": True,
+                    "question": questions[0],
+                    "questions": questions,
+                    "difficulty": difficulty,
+                }
+            )
+
+        except:
+            abort(422)
+
+    # ----------------------------------------------------------------------------#
+    # POST new quiz session.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/quizzes/sessions", methods=["POST"])
+    def create_quiz_session():
+        body = request.get_json(silent=True) or {}
 
-        previous_questions = body.get("previous_questions", [])
         quiz_category = body.get("quiz_category", None)
 
         try:
 
-            if quiz_category:
+            category = category_key(quiz_category["id"])
 
-                if quiz_category["id"] == 0:
-                    quiz = Question.query.all()
+            if not question_index().bucket(category):
+                abort(422)
 
-                else:
-                    quiz = Question.query.filter_by(category=quiz_category["id"]).all()
+            session = QuizSession(category, difficulty=start_difficulty(body))
+            quiz_sessions().save(session)
 
-                if not quiz:
-                    return abort(422)
-                print(quiz)
+            return jsonify(
+                {
+                    "success": True,
+                    "session_id": session.id,
+                    "session": session.format(),
+                }
+            )
 
-            selected = []
+        except:
+            abort(422)
 
-            for question in quiz:
-                if question.id not in previous_questions:
-                    selected.append(question.format())
+    # ----------------------------------------------------------------------------#
+    # DELETE quiz session.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/quizzes/sessions/<session_id>", methods=["DELETE"])
+    def delete_quiz_session(session_id):
+        if not quiz_sessions().delete(session_id):
+            abort(404)
 
-            if len(selected) != 0:
-                result = random.choice(selected)
-                return jsonify({"success": True, "question": result})
+        return jsonify({"success": True, "deleted": session_id})
 
-            else:
-                return jsonify({"question": False})
+    # ----------------------------------------------------------------------------#
+    # POST quiz score.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/scores", methods=["POST"])
+    def create_score():
+        body = request.get_json(silent=True) or {}
+
+        session_id = body.get("session_id")
+
+        if session_id is not None:
+            session = quiz_sessions().get(session_id)
+
+            if session is None:
+                abort(404)
+
+            category = session.category
+
+        try:
+
+            if session_id is None:
+                category = int(body["quiz_category"]["id"])
+
+            if category != ALL_CATEGORIES and category not in category_map():
+                abort(422)
+
+            row = validate_score(body, category)
+            place = record_score(row)
+
+            return jsonify(
+                {
+                    "success": True,
+                    "category": category,
+                    "score": row["score"],
+                    "questions": row["questions"],
+                    "place": place,
+                }
+            )
 
         except:
             abort(422)
-            print(sys.exc_info())
+
+    # ----------------------------------------------------------------------------#
+    # GET score buffer statistics.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/scores/buffer", methods=["GET"])
+    def retrieve_score_buffer_stats():
+        return jsonify({"success": True, "buffer": score_buffer().stats()})
+
+    # ----------------------------------------------------------------------------#
+    # GET leaderboards.
+    # ----------------------------------------------------------------------------#
+
+    @app.route("/leaderboards", methods=["GET"])
+    def retrieve_leaderboards():
+        boards = leaderboards()
+
+        return jsonify(
+            {
+                "success": True,
+                "leaderboards": {
+                    category: boards.top(category) for category in boards.categories()
+                },
+            }
+        )
+
+    @app.route("/leaderboards/<int:category_id>", methods=["GET"])
+    def retrieve_leaderboard(category_id):
+        if category_id != ALL_CATEGORIES and category_id not in category_map():
+            abort(404)
+
+        return jsonify(
+            {
+                "success": True,
+                "category": category_id,
+                "leaderboard": leaderboards().top(category_id),
+            }
+        )
 
     """
   @TODO: 
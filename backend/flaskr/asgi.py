@@ -0,0 +1,334 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+try:
+    import databases
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.middleware.wsgi import WSGIMiddleware
+    from starlette.responses import Response
+    from starlette.routing import Mount, Route
+except ImportError:  # pragma: no cover - optional dependency
+    databases = None
+
+from sqlalchemy import select
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+from models import Question
+from . import create_app
+from .categories import category_map
+from .compression import compress_body
+from .counts import question_counts
+from .errors import ERROR_MESSAGES
+from .pagination import decode_cursor, encode_cursor
+from .quiz import QUIZ_MAX_BATCH, QuestionDraw, next_difficulty, question_index
+from .serialization import dumps
+from .sessions import quiz_sessions
+
+# ----------------------------------------------------------------------------#
+# Async Serving Mode.
+#
+# An ASGI application serving the same routes and response shapes as
+# create_app. The read paths that dominate traffic (category and question
+# listings and quiz draws) are async views that read rows through an async
+# driver (the `databases` package), so a worker waits on the database
+# without holding a thread. Every other route is served by the Flask app
+# mounted underneath, in a thread pool, so writes still go through the ORM
+# and the write event hub.
+#
+# The in-memory structures (category map, question counts, quiz index and
+# sessions) are shared with that Flask app. They are reached through a
+# thread pool hop, because a stale structure reloads with a blocking query.
+#
+#     uvicorn --factory flaskr.asgi:create_asgi_app
+# ----------------------------------------------------------------------------#
+
+# What flask_cors and the after_request hook in create_app add to responses.
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,Authorization,true",
+    "Access-Control-Allow-Methods": "GET,PUT,POST,DELETE,OPTIONS",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def async_database_url(url):
+    """`databases` only knows the postgresql:// spelling of Postgres URLs."""
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://") :]
+    return url
+
+
+def create_asgi_app(test_config=None):
+    if databases is None:
+        raise RuntimeError(
+            "the async serving mode needs the starlette and databases packages"
+        )
+
+    app = create_app(test_config)
+    database = databases.Database(
+        async_database_url(
+            app.config.get("ASYNC_DATABASE_URL", app.config["SQLALCHEMY_DATABASE_URI"])
+        )
+    )
+
+    # ------------------------------------------------------------------------#
+    # Helpers.
+    # ------------------------------------------------------------------------#
+
+    async def in_app(function, *args):
+        def call():
+            with app.app_context():
+                return function(*args)
+
+        return await run_in_threadpool(call)
+
+    def render(request, payload, status_code=200):
+        """Encode `payload`, compressed as flaskr.compression would."""
+        with app.app_context():
+            body = dumps(payload)
+
+        headers = dict(CORS_HEADERS)
+        if app.config.get("COMPRESS", True):
+            headers["Vary"] = "Accept-Encoding"
+            if status_code == 200:
+                accepted = parse_accept_header(
+                    request.headers.get("accept-encoding"), Accept
+                )
+                body, encoding = compress_body(body, accepted, app.config)
+                if encoding is not None:
+                    headers["Content-Encoding"] = encoding
+
+        return Response(
+            body, status_code, headers=headers, media_type="application/json"
+        )
+
+    def int_arg(request, name, default):
+        try:
+            return int(request.query_params.get(name, default))
+        except ValueError:
+            return default
+
+    def page_args(request):
+        per_page = int_arg(request, "per_page", app.config["QUESTIONS_PER_PAGE"])
+        per_page = min(max(per_page, 1), app.config["MAX_QUESTIONS_PER_PAGE"])
+
+        return max(int_arg(request, "page", 1), 1), per_page
+
+    def cursor_arg(request):
+        if "after" not in request.query_params:
+            return None
+
+        try:
+            return decode_cursor(request.query_params["after"])
+        except ValueError:
+            raise HTTPError(400)
+
+    async def fetch_questions(request, *criteria):
+        """Return (formatted questions, next cursor) for a page or cursor."""
+        page, per_page = page_args(request)
+        last_id = cursor_arg(request)
+        query = select(Question.columns()).order_by(Question.id)
+        for criterion in criteria:
+            query = query.where(criterion)
+
+        if last_id is None:
+            query = query.limit(per_page).offset((page - 1) * per_page)
+        else:
+            query = query.where(Question.id > last_id).limit(per_page + 1)
+
+        rows = [
+            Question.format_row(tuple(row)) for row in await database.fetch_all(query)
+        ]
+        if last_id is None or len(rows) <= per_page:
+            return rows, None
+
+        rows = rows[:per_page]
+        return rows, encode_cursor(rows[-1]["id"])
+
+    async def json_body(request):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPError(400)
+        if not isinstance(body, dict):
+            raise HTTPError(400)
+        return body
+
+    # ------------------------------------------------------------------------#
+    # GET Categories.
+    # ------------------------------------------------------------------------#
+
+    async def retrieve_categories(request):
+        formatted_categories = await in_app(category_map)
+
+        if len(formatted_categories) == 0:
+            raise HTTPError(404)
+
+        return render(
+            request,
+            {
+                "success": True,
+                "categories": formatted_categories,
+                "total_categories": len(formatted_categories),
+            },
+        )
+
+    # ------------------------------------------------------------------------#
+    # GET questions.
+    # ------------------------------------------------------------------------#
+
+    async def retrieve_questions(request):
+        current_questions, next_cursor = await fetch_questions(request)
+
+        if len(current_questions) == 0:
+            raise HTTPError(404)
+
+        formatted_categories = await in_app(category_map)
+        total_questions = await in_app(lambda: question_counts().total())
+        last_category = next(reversed(formatted_categories))
+
+        return render(
+            request,
+            {
+                "success": True,
+                "questions": current_questions,
+                "total_questions": total_questions,
+                "current_category": formatted_categories[last_category],
+                "categories": formatted_categories,
+                "next_cursor": next_cursor,
+            },
+        )
+
+    # ------------------------------------------------------------------------#
+    # GET questions with category_id.
+    # ------------------------------------------------------------------------#
+
+    async def get_categories(request):
+        category_id = request.path_params["category_id"]
+        current_questions, next_cursor = await fetch_questions(
+            request, Question.category == category_id
+        )
+
+        if len(current_questions) == 0:
+            raise HTTPError(404)
+
+        total_questions = await in_app(
+            lambda: question_counts().category_total(category_id)
+        )
+
+        return render(
+            request,
+            {
+                "success": True,
+                "questions": current_questions,
+                "total_questions": total_questions,
+                "current_category": category_id,
+                "next_cursor": next_cursor,
+            },
+        )
+
+    # ------------------------------------------------------------------------#
+    # POST random question within the given category.
+    # ------------------------------------------------------------------------#
+
+    def draw(body):
+        """Resolve the quiz session or category, batch size and target
+        difficulty. Runs in the thread pool, inside the Flask app context."""
+        session_id = body.get("session_id")
+        session = None
+
+        if session_id is not None:
+            session = quiz_sessions().get(session_id)
+            if session is None:
+                raise HTTPError(404)
+            category, excluded = session.category, session.served
+        else:
+            quiz_category = body.get("quiz_category", None)
+            if not quiz_category:
+                raise HTTPError(422)
+            category = quiz_category["id"]
+            excluded = set(
+                int(question_id) for question_id in body.get("previous_questions", [])
+            )
+
+        if not question_index().bucket(category):
+            raise HTTPError(422)
+
+        count = min(
+            max(int(body.get("count", 1)), 1),
+            app.config.get("QUIZ_MAX_BATCH", QUIZ_MAX_BATCH),
+        )
+        return session, category, excluded, count, next_difficulty(body, session)
+
+    async def play_quiz(request):
+        body = await json_body(request)
+
+        try:
+            session, category, excluded, count, difficulty = await in_app(draw, body)
+        except (KeyError, TypeError, ValueError):
+            raise HTTPError(422)
+
+        selection = await in_app(QuestionDraw, category, excluded, count, difficulty)
+        while selection.ids:
+            rows = await database.fetch_all(
+                select(Question.columns()).where(Question.id.in_(selection.ids))
+            )
+            await in_app(
+                selection.found,
+                {row["id"]: Question.format_row(tuple(row)) for row in rows},
+            )
+        questions = selection.questions()
+
+        if not questions:
+            return render(request, {"question": False, "questions": []})
+
+        if session is not None:
+            session.served.update(question["id"] for question in questions)
+            await in_app(lambda: quiz_sessions().save(session))
+
+        return render(
+            request,
+            {
+                "success": True,
+                "question": questions[0],
+                "questions": questions,
+                "difficulty": difficulty,
+            },
+        )
+
+    # ------------------------------------------------------------------------#
+    # Errors.
+    # ------------------------------------------------------------------------#
+
+    async def http_error(request, error):
+        return render(
+            request,
+            {
+                "success": False,
+                "error": error.status_code,
+                "message": ERROR_MESSAGES[error.status_code],
+            },
+            error.status_code,
+        )
+
+    asgi_app = Starlette(
+        routes=[
+            Route("/categories", retrieve_categories, methods=["GET"]),
+            Route("/questions", retrieve_questions, methods=["GET"]),
+            Route("/questions/{category_id:int}", get_categories, methods=["GET"]),
+            Route("/quizzes", play_quiz, methods=["POST"]),
+            Mount("/", app=WSGIMiddleware(app)),
+        ],
+        exception_handlers={HTTPError: http_error},
+        on_startup=[database.connect],
+        on_shutdown=[database.disconnect],
+    )
+    asgi_app.state.flask_app = app
+
+    return asgi_app
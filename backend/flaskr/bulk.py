@@ -0,0 +1,394 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import csv
+import io
+import json
+
+import click
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question
+from . import events
+from .categories import category_lookup, category_map, resolve_category
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+IMPORT_COLUMNS = ("question", "answer", "category", "difficulty")
+EXPORT_BATCH_SIZE = 1000
+BATCH_MAX_ITEMS = 1000
+EXPORT_COLUMNS = Question.fields
+
+# ----------------------------------------------------------------------------#
+# Bulk Question Import.
+#
+# Rows are read from a stream one at a time, validated, and written in
+# batches with one transaction per batch: a multi-row INSERT, or COPY on
+# Postgres. A batch the database rejects is retried row by row so that only
+# the offending rows are reported. Subscribers are told to reload once the
+# load is over instead of hearing about every row.
+# ----------------------------------------------------------------------------#
+
+
+def read_rows(stream, fmt):
+    """Yield (row number, dict) pairs from a binary stream of NDJSON or CSV. A
+    row that cannot be read is yielded with the ValueError that says why."""
+    if fmt == "csv":
+        yield from _read_csv(stream)
+        return
+
+    for number, line in enumerate(stream, start=1):
+        try:
+            line = line.decode("utf-8")
+        except UnicodeDecodeError:
+            yield number, ValueError("row is not valid UTF-8")
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def _read_csv(stream):
+    # Bad bytes are kept as lone surrogates so the reader does not lose its
+    # place in the stream; the row holding them is reported on its own.
+    reader = csv.DictReader(line.decode("utf-8", "surrogateescape") for line in stream)
+    number = 0
+
+    while True:
+        number += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            yield number, ValueError("row is not valid CSV: {}".format(error))
+            continue
+
+        if None in row:
+            yield number, ValueError("row has more fields than the header")
+        elif not _encodes(row.values()):
+            yield number, ValueError("row is not valid UTF-8")
+        else:
+            yield number, row
+
+
+def _encodes(values):
+    try:
+        for value in values:
+            if value is not None:
+                value.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def validate_row(row, lookup):
+    if isinstance(row, ValueError):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("row is not a JSON object")
+
+    values = {}
+    for field in ("question", "answer"):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError("{} is required".format(field))
+        values[field] = value.strip()
+
+    try:
+        difficulty = int(row.get("difficulty"))
+    except (TypeError, ValueError):
+        raise ValueError("difficulty must be an integer")
+    if not 1 <= difficulty <= 5:
+        raise ValueError("difficulty must be between 1 and 5")
+    values["difficulty"] = difficulty
+
+    category = resolve_category(row.get("category"), lookup)
+    if category is None:
+        raise ValueError("unknown category {!r}".format(row.get("category")))
+    values["category"] = category
+
+    return values
+
+
+def _copy_batch(batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in batch:
+        writer.writerow([values[column] for column in IMPORT_COLUMNS])
+    buffer.seek(0)
+
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        "COPY questions ({}) FROM STDIN WITH (FORMAT csv)".format(
+            ", ".join(IMPORT_COLUMNS)
+        ),
+        buffer,
+    )
+
+
+def _insert_batch(batch, use_copy):
+    if use_copy:
+        _copy_batch(batch)
+    else:
+        db.session.execute(Question.__table__.insert(), batch)
+    db.session.commit()
+
+
+class ImportReport:
+    def __init__(self, max_errors=IMPORT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, number, error):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": number, "error": str(error)})
+
+    def format(self):
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+def import_questions(rows, batch_size=None):
+    """Insert validated (row number, dict) pairs in batches. Returns an
+    ImportReport; invalid rows are reported, not raised."""
+    config = current_app.config
+    batch_size = batch_size or config.get("IMPORT_BATCH_SIZE", IMPORT_BATCH_SIZE)
+    use_copy = db.session.get_bind().dialect.name == "postgresql"
+    lookup = category_lookup(category_map())
+    report = ImportReport(config.get("IMPORT_MAX_ERRORS", IMPORT_MAX_ERRORS))
+    numbers, batch = [], []
+
+    def flush():
+        try:
+            _insert_batch(batch, use_copy)
+            report.inserted += len(batch)
+        except SQLAlchemyError:
+            db.session.rollback()
+            for number, values in zip(numbers, batch):
+                try:
+                    _insert_batch([values], False)
+                    report.inserted += 1
+                except SQLAlchemyError as error:
+                    db.session.rollback()
+                    report.fail(number, error.orig if hasattr(error, "orig") else error)
+        del numbers[:], batch[:]
+
+    try:
+        for number, row in rows:
+            try:
+                batch.append(validate_row(row, lookup))
+                numbers.append(number)
+            except ValueError as error:
+                report.fail(number, error)
+                continue
+
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+    finally:
+        if report.inserted:
+            events.reset(Question.__tablename__)
+
+    return report
+
+
+def import_format(request):
+    fmt = request.args.get("format")
+    if fmt:
+        return fmt
+    return "csv" if request.mimetype == "text/csv" else "ndjson"
+
+
+# ----------------------------------------------------------------------------#
+# Batch Create and Delete.
+#
+# A batch is written in one transaction with set-based SQL: one multi-row
+# INSERT ... RETURNING on Postgres (one INSERT per row elsewhere), and one
+# DELETE ... WHERE id IN (...). Every item gets an outcome, and subscribers
+# hear about each affected row so they update in place instead of reloading.
+# ----------------------------------------------------------------------------#
+
+
+def _question_changes(op, rows):
+    return [events.Change(op, Question.__tablename__, dict(row), None) for row in rows]
+
+
+def create_questions(items):
+    """Insert the valid questions in `items` in one transaction. Returns one
+    outcome per item, in order."""
+    lookup = category_lookup(category_map())
+    outcomes, valid = [], []
+
+    for position, item in enumerate(items):
+        try:
+            values = validate_row(item, lookup)
+        except ValueError as error:
+            outcomes.append({"index": position, "success": False, "error": str(error)})
+            continue
+        outcomes.append({"index": position, "success": True, "id": None})
+        valid.append((outcomes[-1], values))
+
+    if not valid:
+        return outcomes
+
+    table = Question.__table__
+    rows = [values for _, values in valid]
+
+    try:
+        if db.session.get_bind().dialect.name == "postgresql":
+            ids = [
+                question_id
+                for (question_id,) in db.session.execute(
+                    table.insert().values(rows).returning(table.c.id)
+                )
+            ]
+        else:
+            ids = [
+                db.session.execute(table.insert(), values).inserted_primary_key[0]
+                for values in rows
+            ]
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
+    for (outcome, values), question_id in zip(valid, ids):
+        outcome["id"] = values["id"] = question_id
+
+    events.publish(_question_changes(events.INSERT, rows))
+    return outcomes
+
+
+def delete_questions(ids):
+    """Delete the questions with the given ids in one transaction. Returns
+    one outcome per id, in order."""
+    errors, wanted = {}, {}
+
+    for position, question_id in enumerate(ids):
+        if isinstance(question_id, bool) or not isinstance(question_id, int):
+            errors[position] = "id must be an integer"
+        elif question_id in wanted:
+            errors[position] = "duplicate id"
+        else:
+            wanted[question_id] = position
+
+    rows = []
+    if wanted:
+        try:
+            rows = [
+                Question.format_row(row)
+                for row in db.session.query(*Question.columns())
+                .filter(Question.id.in_(list(wanted)))
+                .with_for_update()
+            ]
+            if rows:
+                db.session.query(Question).filter(
+                    Question.id.in_([row["id"] for row in rows])
+                ).delete(synchronize_session=False)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+
+    deleted = {row["id"] for row in rows}
+    outcomes = []
+    for position, question_id in enumerate(ids):
+        error = errors.get(position)
+        if error is None and question_id not in deleted:
+            error = "question not found"
+
+        outcome = {"id": question_id, "success": error is None}
+        if error is not None:
+            outcome["error"] = error
+        outcomes.append(outcome)
+
+    events.publish(_question_changes(events.DELETE, rows))
+    return outcomes
+
+
+# ----------------------------------------------------------------------------#
+# Streaming Question Export.
+#
+# Rows are read through a server-side cursor in EXPORT_BATCH_SIZE chunks and
+# each chunk is encoded and handed to the response as soon as it arrives, so
+# memory stays flat and the first bytes go out before the scan finishes.
+# ----------------------------------------------------------------------------#
+
+
+def export_rows(category=None, difficulty=None, batch_size=None):
+    batch_size = batch_size or current_app.config.get(
+        "EXPORT_BATCH_SIZE", EXPORT_BATCH_SIZE
+    )
+    query = db.session.query(*Question.columns()).order_by(Question.id)
+
+    if category is not None:
+        query = query.filter(Question.category == category)
+    if difficulty is not None:
+        query = query.filter(Question.difficulty == difficulty)
+
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_rows(rows, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the rows as NDJSON or CSV text, one chunk of rows at a time."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+        for chunk in _chunks(rows, batch_size):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+        return
+
+    for chunk in _chunks(rows, batch_size):
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in chunk
+        )
+
+
+def init_app(app):
+    @app.cli.command("import-questions")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["ndjson", "csv"]))
+    @click.option("--batch-size", type=int, default=None)
+    def import_questions_command(path, fmt, batch_size):
+        """Import questions from an NDJSON or CSV file."""
+        fmt = fmt or ("csv" if path.endswith(".csv") else "ndjson")
+
+        with open(path, "rb") as stream:
+            report = import_questions(read_rows(stream, fmt), batch_size)
+
+        click.echo(
+            "Inserted {} questions, {} rows failed.".format(
+                report.inserted, report.failed
+            )
+        )
+        for error in report.errors:
+            click.echo("  row {row}: {error}".format(**error), err=True)
@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+from collections import OrderedDict
+
+from flask import current_app
+
+from models import db, Category
+from . import events
+from .reloading import Reloadable
+
+CATEGORY_CACHE_TTL = 300
+
+# ----------------------------------------------------------------------------#
+# Category Map Cache.
+#
+# The {id: type} map is loaded once per worker and dropped whenever a
+# category write commits in this process. Writes made by other workers are
+# picked up when the entry is older than CATEGORY_CACHE_TTL seconds.
+# ----------------------------------------------------------------------------#
+
+
+class CategoryCache(Reloadable):
+    table = Category.__tablename__
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        super().__init__(ttl)
+        self.version = 0
+        self.requests = 0
+        self.misses = 0
+
+    def load(self):
+        self.misses += 1
+        self.version += 1
+        rows = db.session.query(Category.id, Category.type).order_by(Category.id)
+        return OrderedDict(rows)
+
+    def get(self):
+        """Return the cached {id: type} map, ordered by id. Do not mutate it."""
+        self.requests += 1
+        return self.current()
+
+    def apply(self, changes):
+        self.invalidate()
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "hits": self.requests - self.misses,
+            "misses": self.misses,
+            "size": len(self._state or ()),
+            "ttl": self.ttl,
+        }
+
+
+def init_app(app):
+    cache = CategoryCache(app.config.get("CATEGORY_CACHE_TTL", CATEGORY_CACHE_TTL))
+    app.extensions["trivia_categories"] = cache
+    events.subscribe(app, cache.on_changes)
+
+
+def category_cache():
+    return current_app.extensions["trivia_categories"]
+
+
+def category_map():
+    return category_cache().get()
+
+
+def category_lookup(categories):
+    """Map both category ids and lower-cased names to the category id."""
+    lookup = {str(category_id): category_id for category_id in categories}
+    lookup.update(
+        (name.lower(), category_id) for category_id, name in categories.items()
+    )
+    return lookup
+
+
+def resolve_category(value, lookup=None):
+    """Return the id of the category given by id or name, or None."""
+    if lookup is None:
+        lookup = category_lookup(category_map())
+    return lookup.get(str(value).strip().lower())
@@ -0,0 +1,161 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import itertools
+import threading
+from collections import deque
+
+from flask import current_app
+
+from models import Question, Category
+from . import events
+from .serialization import dumps
+
+CHANGE_FEED_SIZE = 1000
+CHANGE_FEED_HEARTBEAT = 15
+
+# ----------------------------------------------------------------------------#
+# Change Feed.
+#
+# Committed question and category writes are kept as compact events in a
+# bounded ring buffer, numbered in commit order, so clients apply deltas
+# instead of re-downloading listings. GET /changes streams them as
+# server-sent events, and GET /changes?since=<version> returns the events
+# after a version for clients that poll.
+#
+# A version is "<process id>-<sequence>", like the ETags of conditional
+# requests. A client is told to resync (re-fetch what it mirrors, then follow
+# from the version it is given) when its version comes from another worker
+# or an earlier process, when the events it missed have left the ring, or
+# when a bulk load reset the tables.
+# ----------------------------------------------------------------------------#
+
+TABLES = (Question.__tablename__, Category.__tablename__)
+
+
+def compact(change):
+    """The event for a change: inserts and updates carry the row, deletes
+    only what a client needs to drop it."""
+    event = {"op": change.op, "table": change.table}
+
+    if change.op == events.DELETE:
+        event["id"] = change.row["id"]
+        if change.table == Question.__tablename__:
+            event["category"] = change.row["category"]
+    elif change.table == Question.__tablename__:
+        event["row"] = Question.format_row(
+            tuple(change.row.get(field) for field in Question.fields)
+        )
+    else:
+        event["row"] = {"id": change.row["id"], "type": change.row["type"]}
+
+    return event
+
+
+class ChangeFeed:
+    def __init__(self, process_id, size=CHANGE_FEED_SIZE):
+        self.process_id = process_id
+        self.sequence = 0
+        # Versions at or before the floor can not be followed: their events
+        # were dropped by a reset.
+        self.floor = 0
+        self._events = deque(maxlen=size)
+        self._changed = threading.Condition()
+
+    def version(self, sequence=None):
+        return "{}-{}".format(
+            self.process_id, self.sequence if sequence is None else sequence
+        )
+
+    def parse(self, version):
+        """Return the sequence of a version issued by this feed, or None."""
+        process_id, _, sequence = str(version).rpartition("-")
+        if process_id != self.process_id or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def on_changes(self, changes):
+        with self._changed:
+            for change in changes:
+                if change.table not in TABLES:
+                    continue
+
+                self.sequence += 1
+                if change.op == events.RESET:
+                    self._events.clear()
+                    self.floor = self.sequence
+                    continue
+
+                event = dict(compact(change), version=self.version())
+                self._events.append((self.sequence, event, dumps(event)))
+
+            self._changed.notify_all()
+
+    def since(self, version):
+        """Return the (sequence, event, encoded event) triples after
+        `version`, or None when the client has to resync."""
+        sequence = self.parse(version)
+
+        with self._changed:
+            if sequence is None or not self.floor <= sequence <= self.sequence:
+                return None
+
+            first = self._events[0][0] if self._events else self.sequence + 1
+            if sequence < first - 1:
+                return None
+
+            return list(itertools.islice(self._events, sequence - first + 1, None))
+
+    def wait(self, version, timeout):
+        """Like since(), but block up to `timeout` seconds for an event."""
+        sequence = self.parse(version)
+
+        with self._changed:
+            self._changed.wait_for(
+                lambda: sequence is None or self.sequence != sequence, timeout
+            )
+            return self.since(version)
+
+
+def init_app(app):
+    feed = ChangeFeed(
+        app.extensions["trivia_data_version"].process_id,
+        app.config.get("CHANGE_FEED_SIZE", CHANGE_FEED_SIZE),
+    )
+    app.extensions["trivia_change_feed"] = feed
+    events.subscribe(app, feed.on_changes)
+
+
+def change_feed():
+    return current_app.extensions["trivia_change_feed"]
+
+
+def _control_event(name, version):
+    return "id: {}\nevent: {}\ndata: {}\n\n".format(
+        version, name, dumps({"version": version}).decode("utf-8")
+    )
+
+
+def stream_changes(feed, version, heartbeat):
+    """Yield the server-sent events after `version` (the current version when
+    None), forever. A comment is sent every `heartbeat` seconds without
+    events, so proxies keep the connection open and a closed one is noticed.
+    """
+    if version is None:
+        version = feed.version()
+    yield "retry: 3000\n\n" + _control_event("ready", version)
+
+    while True:
+        pending = feed.wait(version, heartbeat)
+
+        if pending is None:
+            version = feed.version()
+            yield _control_event("resync", version)
+        elif not pending:
+            yield ": keepalive\n\n"
+        else:
+            for _, event, encoded in pending:
+                yield "id: {}\ndata: {}\n\n".format(
+                    event["version"], encoded.decode("utf-8")
+                )
+            version = pending[-1][1]["version"]
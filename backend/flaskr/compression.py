@@ -0,0 +1,138 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import gzip
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/plain",
+    "text/html",
+)
+
+# ----------------------------------------------------------------------------#
+# Response Compression.
+#
+# Responses are compressed with the best encoding the client accepts: brotli
+# when the brotli package is installed, gzip otherwise. Bodies smaller than
+# COMPRESS_MIN_SIZE bytes are sent as they are, where the saving would not
+# pay for the CPU. Streamed exports are compressed chunk by chunk; event
+# streams are left alone so every event is delivered when it is sent.
+#
+# Pages served from the response cache are already compressed, once, when
+# they are stored (see flaskr.response_cache), and pass through untouched.
+# ----------------------------------------------------------------------------#
+
+
+def encodings():
+    """The encodings this process can produce, best first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accepted, available):
+    """Return the encoding of `available` the client prefers, or None."""
+    best, best_quality = None, 0
+    for encoding in available:
+        quality = accepted[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding, level):
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, level)
+
+
+def compress_stream(chunks, encoding, level):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        finish = compressor.finish
+        process = compressor.process
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        finish = compressor.flush
+        process = compressor.compress
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = process(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def level(encoding, config):
+    if encoding == "br":
+        return config.get("COMPRESS_BROTLI_QUALITY", COMPRESS_BROTLI_QUALITY)
+    return config.get("COMPRESS_LEVEL", COMPRESS_LEVEL)
+
+
+def compress_body(body, accepted, config):
+    """Return (body, encoding) for a response body: compressed with the
+    client's preferred encoding, or untouched with None when it accepts none
+    or the body is under the threshold."""
+    encoding = negotiate(accepted, encodings())
+    if encoding is None or len(body) < config.get(
+        "COMPRESS_MIN_SIZE", COMPRESS_MIN_SIZE
+    ):
+        return body, None
+    return compress(body, encoding, level(encoding, config)), encoding
+
+
+def compressible(response):
+    return (
+        response.status_code == 200
+        and "Content-Encoding" not in response.headers
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+    )
+
+
+def init_app(app):
+    if not app.config.get("COMPRESS", True):
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if not compressible(response):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        config = current_app.config
+
+        if response.is_streamed:
+            encoding = negotiate(request.accept_encodings, encodings())
+            if encoding is None:
+                return response
+            response.response = compress_stream(
+                response.response, encoding, level(encoding, config)
+            )
+            response.headers.pop("Content-Length", None)
+        else:
+            body, encoding = compress_body(
+                response.get_data(), request.accept_encodings, config
+            )
+            if encoding is None:
+                return response
+            response.set_data(body)
+
+        response.headers["Content-Encoding"] = encoding
+        return response
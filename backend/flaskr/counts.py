@@ -0,0 +1,122 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Question
+from . import events
+from .reloading import Reloadable
+
+QUESTION_COUNTS_TTL = 300
+
+# ----------------------------------------------------------------------------#
+# Question Counts.
+#
+# Question totals per category and per (category, difficulty) are loaded with
+# one GROUP BY and then kept current by write events, so listings report
+# their totals without a COUNT(*). Like the quiz index, the counts are
+# reloaded in the background after QUESTION_COUNTS_TTL seconds to reconcile
+# writes made by other workers.
+# ----------------------------------------------------------------------------#
+
+
+class QuestionCounts(Reloadable):
+    table = Question.__tablename__
+    background = True
+
+    def __init__(self, ttl=QUESTION_COUNTS_TTL):
+        super().__init__(ttl)
+
+    def load(self):
+        """Return ({category: count}, {(category, difficulty): count})."""
+        rows = db.session.query(
+            Question.category, Question.difficulty, func.count(Question.id)
+        ).group_by(Question.category, Question.difficulty)
+
+        categories = {}
+        cells = {}
+        for category, difficulty, count in rows:
+            categories[category] = categories.get(category, 0) + count
+            cells[(category, difficulty)] = count
+
+        return categories, cells
+
+    def total(self):
+        categories, _ = self.current()
+        with self._lock:
+            return sum(categories.values())
+
+    def category_total(self, category):
+        categories, _ = self.current()
+        return categories.get(category, 0)
+
+    def cells(self):
+        """Return a copy of the {(category, difficulty): count} map."""
+        _, cells = self.current()
+        with self._lock:
+            return dict(cells)
+
+    def _adjust(self, category, difficulty, delta):
+        categories, cells = self._state
+        key = (category, difficulty)
+        categories[category] = categories.get(category, 0) + delta
+        cells[key] = cells.get(key, 0) + delta
+        if not cells[key]:
+            del cells[key]
+        if not categories[category]:
+            del categories[category]
+
+    def apply(self, changes):
+        for change in changes:
+            if change.op == events.INSERT:
+                self._adjust(change.row["category"], change.row["difficulty"], 1)
+            elif change.op == events.DELETE:
+                self._adjust(change.row["category"], change.row["difficulty"], -1)
+            elif change.op == events.UPDATE and (
+                "category" in change.previous or "difficulty" in change.previous
+            ):
+                before = dict(change.row, **change.previous)
+                self._adjust(before["category"], before["difficulty"], -1)
+                self._adjust(change.row["category"], change.row["difficulty"], 1)
+
+
+def init_app(app):
+    counts = QuestionCounts(app.config.get("QUESTION_COUNTS_TTL", QUESTION_COUNTS_TTL))
+    app.extensions["trivia_question_counts"] = counts
+    events.subscribe(app, counts.on_changes)
+
+
+def question_counts():
+    return current_app.extensions["trivia_question_counts"]
+
+
+def category_stats(categories):
+    """Return totals for every category in the {id: type} map `categories`,
+    broken down by difficulty, plus the bank-wide totals."""
+    counts = question_counts()
+    cells = counts.cells()
+
+    stats = {
+        category_id: {"type": name, "total_questions": 0, "difficulties": {}}
+        for category_id, name in categories.items()
+    }
+    difficulties = {}
+    uncategorized = 0
+
+    for (category, difficulty), count in sorted(
+        cells.items(), key=lambda item: (item[0][0] or 0, item[0][1] or 0)
+    ):
+        difficulties[difficulty] = difficulties.get(difficulty, 0) + count
+        if category in stats:
+            stats[category]["total_questions"] += count
+            stats[category]["difficulties"][difficulty] = count
+        else:
+            uncategorized += count
+
+    return {
+        "categories": stats,
+        "difficulties": difficulties,
+        "uncategorized": uncategorized,
+        "total_questions": sum(cells.values()),
+    }
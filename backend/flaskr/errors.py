@@ -0,0 +1,13 @@
+# ----------------------------------------------------------------------------#
+# Error Messages.
+#
+# The message sent with each error status, shared by every serving mode so
+# the error bodies stay the same whichever one answers.
+# ----------------------------------------------------------------------------#
+
+ERROR_MESSAGES = {
+    400: "Bad Request",
+    404: "Resource Not Found",
+    405: "Method Not Allowed",
+    422: "Unprocessable",
+}
@@ -0,0 +1,112 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+
+from models import db
+
+# ----------------------------------------------------------------------------#
+# Write Events.
+#
+# In-process read structures (caches, indexes, counters) subscribe here to
+# hear about committed writes. ORM writes are collected on flush and published
+# once the transaction commits, so a rolled back write is never seen. Writes
+# that bypass the ORM (bulk SQL) call publish() themselves after committing.
+# ----------------------------------------------------------------------------#
+
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+RESET = "reset"
+
+# row holds the column values after the write (before it, for a delete);
+# previous holds the old values of the columns an update changed.
+Change = namedtuple("Change", ["op", "table", "row", "previous"])
+
+
+class WriteEvents:
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def publish(self, changes):
+        if not changes:
+            return
+
+        for callback in self._subscribers:
+            callback(changes)
+
+
+def init_app(app):
+    app.extensions["trivia_events"] = WriteEvents()
+
+
+def subscribe(app, callback):
+    app.extensions["trivia_events"].subscribe(callback)
+
+
+def publish(changes):
+    if has_app_context() and "trivia_events" in current_app.extensions:
+        current_app.extensions["trivia_events"].publish(changes)
+
+
+def reset(table):
+    """Tell subscribers that `table` changed in ways they must reload."""
+    publish([Change(RESET, table, None, None)])
+
+
+def _snapshot(state):
+    return {attr.key: state.dict.get(attr.key) for attr in state.attrs}
+
+
+def _previous(state):
+    previous = {}
+
+    for attr in state.attrs:
+        history = attr.history
+        if history.has_changes() and history.deleted:
+            previous[attr.key] = history.deleted[0]
+
+    return previous
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault("trivia_changes", [])
+
+    for obj in session.new:
+        state = inspect(obj)
+        pending.append(
+            Change(INSERT, state.mapper.local_table.name, _snapshot(state), None)
+        )
+
+    for obj in session.dirty:
+        state = inspect(obj)
+        previous = _previous(state)
+        if previous:
+            pending.append(
+                Change(
+                    UPDATE, state.mapper.local_table.name, _snapshot(state), previous
+                )
+            )
+
+    for obj in session.deleted:
+        state = inspect(obj)
+        pending.append(
+            Change(DELETE, state.mapper.local_table.name, _snapshot(state), None)
+        )
+
+
+@event.listens_for(db.session, "after_commit")
+def _publish_changes(session):
+    publish(session.info.pop("trivia_changes", None))
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _discard_changes(session, previous_transaction):
+    session.info.pop("trivia_changes", None)
@@ -0,0 +1,227 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import bisect
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+SLOW_REQUEST_STATEMENTS = 5
+
+# ----------------------------------------------------------------------------#
+# Request Metrics.
+#
+# Every SQL statement run while serving a request is counted and timed on
+# flask.g by engine hooks. When the request finishes its latency, statement
+# count, database time and response size are added to per-route histograms,
+# served in the Prometheus text format at /metrics.
+# ----------------------------------------------------------------------------#
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += 1
+        series[2] += value
+
+    def expose(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.help),
+            "# TYPE {} histogram".format(self.name),
+        ]
+        for labels, (counts, total, value_sum) in sorted(self._series.items()):
+            label_text = ",".join('{}="{}"'.format(key, value) for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(
+                    '{}_bucket{{{},le="{}"}} {}'.format(
+                        self.name, label_text, bound, cumulative
+                    )
+                )
+            lines.append(
+                '{}_bucket{{{},le="+Inf"}} {}'.format(self.name, label_text, total)
+            )
+            lines.append("{}_sum{{{}}} {}".format(self.name, label_text, value_sum))
+            lines.append("{}_count{{{}}} {}".format(self.name, label_text, total))
+        return lines
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duration = Histogram(
+            "trivia_request_duration_seconds",
+            "Time spent serving the request.",
+            DURATION_BUCKETS,
+        )
+        self.queries = Histogram(
+            "trivia_request_sql_statements",
+            "SQL statements run while serving the request.",
+            QUERY_BUCKETS,
+        )
+        self.db_time = Histogram(
+            "trivia_request_db_seconds",
+            "Time spent in SQL statements while serving the request.",
+            DURATION_BUCKETS,
+        )
+        self.size = Histogram(
+            "trivia_response_size_bytes",
+            "Size of the response body.",
+            SIZE_BUCKETS,
+        )
+
+    def observe(self, labels, duration, queries, db_time, size):
+        with self._lock:
+            self.duration.observe(labels, duration)
+            self.queries.observe(labels, queries)
+            self.db_time.observe(labels, db_time)
+            if size is not None:
+                self.size.observe(labels, size)
+
+    def expose(self, gauges=()):
+        with self._lock:
+            lines = []
+            for histogram in (self.duration, self.queries, self.db_time, self.size):
+                lines.extend(histogram.expose())
+        for name, help, value in gauges:
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} counter".format(name))
+            lines.append("{} {}".format(name, value))
+        return "\n".join(lines) + "\n"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "sql_statements" in g:
+        conn.info.setdefault("trivia_query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("trivia_query_started")
+    if not started or not has_request_context() or "sql_statements" not in g:
+        return
+    g.sql_statements.append((statement, time.perf_counter() - started.pop()))
+
+
+def _route_labels():
+    rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    return (("method", request.method), ("route", rule))
+
+
+def init_app(app):
+    metrics = RequestMetrics()
+    app.extensions["trivia_metrics"] = metrics
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        g.sql_statements = []
+
+    @app.after_request
+    def record_request_metrics(response):
+        if "request_started" not in g:
+            return response
+
+        duration = time.perf_counter() - g.request_started
+        statements = g.sql_statements
+        db_time = sum(elapsed for _, elapsed in statements)
+        size = None if response.is_streamed else response.calculate_content_length()
+
+        metrics.observe(_route_labels(), duration, len(statements), db_time, size)
+
+        if app.config.get("QUERY_COUNT_HEADER", app.testing or app.debug):
+            response.headers["X-Query-Count"] = str(len(statements))
+            response.headers["X-DB-Time"] = "{:.6f}".format(db_time)
+
+        slow_ms = app.config.get("SLOW_REQUEST_MS")
+        if slow_ms is not None and duration * 1000 >= slow_ms:
+            slowest = sorted(statements, key=lambda item: item[1], reverse=True)
+            app.logger.warning(
+                "Slow request %s %s: %.1fms, %d statements, %.1fms in SQL%s",
+                request.method,
+                request.full_path.rstrip("?"),
+                duration * 1000,
+                len(statements),
+                db_time * 1000,
+                "".join(
+                    "\n  %.1fms %s" % (elapsed * 1000, " ".join(statement.split()))
+                    for statement, elapsed in slowest[:SLOW_REQUEST_STATEMENTS]
+                ),
+            )
+
+        return response
+
+
+def request_metrics():
+    return current_app.extensions["trivia_metrics"]
+
+
+def expose_metrics():
+    cache = current_app.extensions["trivia_categories"].stats()
+    counters = [
+        (
+            "trivia_category_cache_hits_total",
+            "Category map reads served from the cache.",
+            cache["hits"],
+        ),
+        (
+            "trivia_category_cache_misses_total",
+            "Category map reads that loaded from the database.",
+            cache["misses"],
+        ),
+    ]
+
+    responses = current_app.extensions.get("trivia_response_cache")
+    if responses is not None:
+        counters.extend(
+            [
+                (
+                    "trivia_response_cache_hits_total",
+                    "Listing responses served from the response cache.",
+                    responses.hits,
+                ),
+                (
+                    "trivia_response_cache_misses_total",
+                    "Listing responses rendered by the view.",
+                    responses.misses,
+                ),
+            ]
+        )
+
+    replicas = current_app.extensions.get("trivia_replicas")
+    if replicas is not None and replicas.binds:
+        counters.extend(
+            [
+                (
+                    "trivia_replica_reads_total",
+                    "Read-only requests routed to a read replica.",
+                    replicas.replica_reads,
+                ),
+                (
+                    "trivia_primary_reads_total",
+                    "Read-only requests kept on the primary after a write.",
+                    replicas.primary_reads,
+                ),
+            ]
+        )
+
+    return request_metrics().expose(counters)
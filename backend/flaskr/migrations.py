@@ -0,0 +1,110 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import click
+from sqlalchemy import Integer, inspect
+
+from models import db, Question
+
+# ----------------------------------------------------------------------------#
+# Category Foreign Key Migration.
+#
+# Older databases created from the models store questions.category as text,
+# holding either a category id ("4") or a category name ("Science"). This
+# moves them to an integer foreign key to categories.id and creates the
+# composite indexes declared on Question. Values that match neither an id nor
+# a name become NULL and are reported. Databases that already use an integer
+# column (such as those restored from trivia.psql) only get the indexes.
+# ----------------------------------------------------------------------------#
+
+BACKFILL_STATEMENTS = (
+    "ALTER TABLE questions ADD COLUMN category_id integer",
+    "UPDATE questions SET category_id = CAST(trim(category) AS integer) "
+    "WHERE category ~ '^\\s*[0-9]+\\s*$'",
+    "UPDATE questions SET category_id = categories.id FROM categories "
+    "WHERE questions.category_id IS NULL "
+    "AND lower(trim(questions.category)) = lower(categories.type)",
+    "UPDATE questions SET category_id = NULL WHERE category_id IS NOT NULL "
+    "AND category_id NOT IN (SELECT id FROM categories)",
+)
+
+SWAP_STATEMENTS = (
+    "ALTER TABLE questions DROP COLUMN category",
+    "ALTER TABLE questions RENAME COLUMN category_id TO category",
+    "ALTER TABLE questions ADD CONSTRAINT category FOREIGN KEY (category) "
+    "REFERENCES categories(id) ON UPDATE CASCADE ON DELETE SET NULL",
+)
+
+UNMAPPED_QUERY = (
+    "SELECT category, count(*) FROM questions "
+    "WHERE category_id IS NULL AND category IS NOT NULL "
+    "GROUP BY category ORDER BY count(*) DESC"
+)
+
+
+def category_is_integer(engine):
+    for column in inspect(engine).get_columns(Question.__tablename__):
+        if column["name"] == "category":
+            return isinstance(column["type"], Integer)
+    raise click.ClickException("questions.category does not exist")
+
+
+def create_category_indexes(connection):
+    existing = {
+        index["name"]
+        for index in inspect(connection).get_indexes(Question.__tablename__)
+    }
+    for index in Question.__table__.indexes:
+        if index.name not in existing:
+            index.create(connection)
+
+
+def migrate_category_column(engine, dry_run=False):
+    """Return a list of (legacy value, row count) that could not be mapped."""
+    if category_is_integer(engine):
+        if not dry_run:
+            with engine.begin() as connection:
+                create_category_indexes(connection)
+        return []
+
+    if engine.dialect.name != "postgresql":
+        raise click.ClickException(
+            "only Postgres databases can be migrated in place; "
+            "recreate this database from the models instead"
+        )
+
+    connection = engine.connect()
+    transaction = connection.begin()
+    try:
+        for statement in BACKFILL_STATEMENTS:
+            connection.execute(statement)
+        unmapped = [tuple(row) for row in connection.execute(UNMAPPED_QUERY)]
+
+        if dry_run:
+            transaction.rollback()
+            return unmapped
+
+        for statement in SWAP_STATEMENTS:
+            connection.execute(statement)
+        create_category_indexes(connection)
+        transaction.commit()
+        return unmapped
+    except Exception:
+        transaction.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def init_app(app):
+    @app.cli.command("migrate-category-fk")
+    @click.option("--dry-run", is_flag=True, help="Report unmapped values only.")
+    def migrate_category_fk_command(dry_run):
+        """Convert questions.category to an indexed integer foreign key."""
+        unmapped = migrate_category_column(db.engine, dry_run)
+
+        for value, count in unmapped:
+            click.echo("unmapped category {!r}: {} questions".format(value, count))
+        click.echo(
+            "Dry run, nothing changed." if dry_run else "questions.category migrated."
+        )
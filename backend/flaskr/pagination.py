@@ -0,0 +1,105 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import base64
+import binascii
+
+from flask import abort, current_app
+
+from models import Question
+
+# ----------------------------------------------------------------------------#
+# Questions Pagination.
+#
+# Pages are cut in the database with LIMIT/OFFSET, so a request never loads
+# rows it is not going to return. Totals come from flaskr.counts.
+# ----------------------------------------------------------------------------#
+
+
+def page_args(request):
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get(
+        "per_page", current_app.config["QUESTIONS_PER_PAGE"], type=int
+    )
+    per_page = min(max(per_page, 1), current_app.config["MAX_QUESTIONS_PER_PAGE"])
+
+    return max(page, 1), per_page
+
+
+def paginate_questions(request, query):
+    page, per_page = page_args(request)
+
+    selection = (
+        query.with_entities(*Question.columns())
+        .order_by(Question.id)
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    )
+
+    return [Question.format_row(row) for row in selection]
+
+
+# ----------------------------------------------------------------------------#
+# Keyset (cursor) Pagination.
+#
+# The cursor is an opaque token wrapping the last Question.id of a page. The
+# next page is read with `id > last_id ORDER BY id LIMIT n`, which is an index
+# range scan on the primary key whatever the depth, and inserts or deletes
+# elsewhere in the table never shift a page that has already been handed out.
+# ----------------------------------------------------------------------------#
+
+
+def encode_cursor(question_id):
+    token = "q:{}".format(question_id).encode("ascii")
+    return base64.urlsafe_b64encode(token).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """Return the question id wrapped by `token`, 0 for an empty token.
+
+    Raises ValueError when the token was not produced by encode_cursor.
+    """
+    if not token:
+        return 0
+
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        prefix, question_id = (
+            base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii").split(":")
+        )
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError("malformed cursor")
+
+    if prefix != "q" or not question_id.isdigit():
+        raise ValueError("malformed cursor")
+
+    return int(question_id)
+
+
+def cursor_arg(request):
+    """Return the decoded `after` cursor, or None when the request is paged."""
+    if "after" not in request.args:
+        return None
+
+    try:
+        return decode_cursor(request.args.get("after"))
+    except ValueError:
+        abort(400)
+
+
+def keyset_questions(request, query, last_id):
+    _, per_page = page_args(request)
+
+    selection = (
+        query.with_entities(*Question.columns())
+        .filter(Question.id > last_id)
+        .order_by(Question.id)
+        .limit(per_page + 1)
+        .all()
+    )
+
+    has_more = len(selection) > per_page
+    selection = selection[:per_page]
+    next_cursor = encode_cursor(selection[-1].id) if has_more else None
+
+    return [Question.format_row(row) for row in selection], next_cursor
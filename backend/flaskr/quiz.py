@@ -0,0 +1,327 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import math
+import random
+from array import array
+
+from flask import current_app
+
+from models import db, Question
+from . import events
+from .reloading import Reloadable
+
+QUIZ_INDEX_TTL = 300
+QUIZ_MAX_BATCH = 20
+ALL_CATEGORIES = 0
+
+# Rejection sampling gives up and falls back to filtering the bucket once the
+# excluded ids cover this share of it, where draws would mostly miss.
+DENSE_EXCLUSION_RATIO = 0.5
+MAX_DRAWS = 32
+
+# Adaptive quizzes aim each draw at a target difficulty, which moves up by
+# QUIZ_DIFFICULTY_STEP after a correct answer and down after a wrong one.
+# Difficulties further than QUIZ_DIFFICULTY_SPREAD from the target become
+# rapidly less likely.
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+QUIZ_DIFFICULTY_STEP = 0.5
+QUIZ_DIFFICULTY_SPREAD = 1.0
+
+# ----------------------------------------------------------------------------#
+# Quiz Question Index.
+#
+# Question ids are kept in memory, one compact array per category plus one
+# for the whole bank, so a quiz question is drawn without loading the
+# candidate rows. Only the chosen row is read, by primary key. The index is
+# kept current by write events and reloaded in the background after
+# QUIZ_INDEX_TTL seconds to pick up writes made by other workers; a drawn id
+# whose row has gone is dropped and redrawn.
+#
+# Each of those arrays is also split by difficulty, so an adaptive draw
+# picks a difficulty from at most five weights and then draws from that
+# array, whatever the size of the bank.
+# ----------------------------------------------------------------------------#
+
+
+def category_key(category):
+    if category is None:
+        return None
+    return int(category)
+
+
+class QuestionIndex(Reloadable):
+    table = Question.__tablename__
+    background = True
+
+    def __init__(self, ttl=QUIZ_INDEX_TTL, spread=QUIZ_DIFFICULTY_SPREAD):
+        super().__init__(ttl)
+        self.spread = spread
+
+    def load(self):
+        """Return ({category: ids}, {category: {difficulty: ids}})."""
+        buckets = {ALL_CATEGORIES: array("q")}
+        cells = {ALL_CATEGORIES: {}}
+        rows = db.session.query(
+            Question.id, Question.category, Question.difficulty
+        ).order_by(Question.id)
+
+        for question_id, category, difficulty in rows:
+            buckets[ALL_CATEGORIES].append(question_id)
+            cells[ALL_CATEGORIES].setdefault(difficulty, array("q")).append(question_id)
+            if category is not None:
+                buckets.setdefault(category, array("q")).append(question_id)
+                cells.setdefault(category, {}).setdefault(
+                    difficulty, array("q")
+                ).append(question_id)
+
+        return buckets, cells
+
+    def _key(self, category):
+        key = category_key(category)
+        return ALL_CATEGORIES if key is None else key
+
+    def bucket(self, category):
+        buckets, _ = self.current()
+        return buckets.get(self._key(category), ())
+
+    def cells(self, category):
+        """Return {difficulty: ids} for `category`. Do not mutate it."""
+        _, cells = self.current()
+        return cells.get(self._key(category), {})
+
+    def add(self, question_id, category, difficulty=None):
+        with self._lock:
+            if self._state is None:
+                return
+            buckets, cells = self._state
+            keys = [ALL_CATEGORIES]
+            if category is not None:
+                keys.append(category_key(category))
+            for key in keys:
+                buckets.setdefault(key, array("q")).append(question_id)
+                cells.setdefault(key, {}).setdefault(difficulty, array("q")).append(
+                    question_id
+                )
+
+    def remove(self, question_id, category=None):
+        """Drop `question_id`; every bucket is searched if `category` is None."""
+        with self._lock:
+            if self._state is None:
+                return
+            buckets, cells = self._state
+            if category is None:
+                keys = list(buckets)
+            else:
+                keys = [ALL_CATEGORIES, category_key(category)]
+            for key in keys:
+                _discard(buckets.get(key, ()), question_id)
+                for ids in cells.get(key, {}).values():
+                    _discard(ids, question_id)
+
+    def apply(self, changes):
+        for change in changes:
+            row = change.row
+            if change.op == events.INSERT:
+                self.add(row["id"], row["category"], row["difficulty"])
+            elif change.op == events.DELETE:
+                self.remove(row["id"], row["category"])
+            elif change.op == events.UPDATE and (
+                "category" in change.previous or "difficulty" in change.previous
+            ):
+                self.remove(row["id"], change.previous.get("category", row["category"]))
+                self.add(row["id"], row["category"], row["difficulty"])
+
+    def sample(self, category, excluded, count=1, difficulty=None):
+        """Draw up to `count` distinct ids from `category` that are not in
+        `excluded`. `excluded` only needs to support `in` and `len`. With a
+        target `difficulty` the draw is weighted toward it."""
+        if difficulty is None:
+            return sample_ids(self.bucket(category), excluded, count)
+        return sample_weighted(
+            self.cells(category), excluded, count, difficulty, self.spread
+        )
+
+
+def sample_ids(ids, excluded, count=1):
+    """Draw up to `count` distinct ids from the sequence `ids` that are not in
+    `excluded`."""
+    size = len(ids)
+    if size == 0 or count <= 0:
+        return []
+
+    if len(excluded) < size * DENSE_EXCLUSION_RATIO:
+        chosen = []
+        seen = set()
+        for _ in range(MAX_DRAWS * count):
+            question_id = ids[random.randrange(len(ids))]
+            if question_id in excluded or question_id in seen:
+                continue
+            seen.add(question_id)
+            chosen.append(question_id)
+            if len(chosen) == count:
+                return chosen
+
+    candidates = [question_id for question_id in ids if question_id not in excluded]
+    return random.sample(candidates, min(count, len(candidates)))
+
+
+def difficulty_weight(difficulty, target, spread=QUIZ_DIFFICULTY_SPREAD):
+    return math.exp(-(((difficulty - target) / spread) ** 2) / 2)
+
+
+def sample_weighted(cells, excluded, count, target, spread=QUIZ_DIFFICULTY_SPREAD):
+    """Draw up to `count` distinct ids from the {difficulty: ids} `cells`,
+    choosing the difficulty of each draw with a weight that falls off with
+    its distance from `target`. Questions without a difficulty are only
+    drawn once the rated ones have run out."""
+    weights = {
+        difficulty: difficulty_weight(difficulty, target, spread)
+        for difficulty, ids in cells.items()
+        if difficulty is not None and len(ids)
+    }
+    chosen = []
+    picked = Excluding(excluded, chosen)
+
+    while len(chosen) < count and weights:
+        difficulty = random.choices(list(weights), list(weights.values()))[0]
+        drawn = sample_ids(cells[difficulty], picked, 1)
+        if drawn:
+            chosen.append(drawn[0])
+        else:
+            del weights[difficulty]
+
+    if len(chosen) < count and cells.get(None):
+        chosen.extend(sample_ids(cells[None], picked, count - len(chosen)))
+
+    return chosen
+
+
+def clamp_difficulty(target):
+    return min(max(float(target), MIN_DIFFICULTY), MAX_DIFFICULTY)
+
+
+def start_difficulty(body):
+    """The target difficulty a new quiz session starts from: the request's
+    `difficulty`, or None for uniform draws when it sends none."""
+    target = body.get("difficulty")
+    return None if target is None else clamp_difficulty(target)
+
+
+def next_difficulty(body, session=None):
+    """Return the target difficulty for the next draw, or None for a plain
+    uniform draw. The target comes from the quiz session, or from the
+    request's `difficulty` when there is none, and is moved by the answer
+    reported in `correct`. A session keeps its new target."""
+    target = session.difficulty if session is not None else body.get("difficulty")
+    if target is None:
+        return None
+
+    target = float(target)
+    if body.get("correct") is not None:
+        step = current_app.config.get("QUIZ_DIFFICULTY_STEP", QUIZ_DIFFICULTY_STEP)
+        target += step if body["correct"] else -step
+    target = clamp_difficulty(target)
+
+    if session is not None:
+        session.difficulty = target
+    return target
+
+
+def _discard(ids, question_id):
+    # Deletes are rare next to draws, so a linear search keeps the buckets as
+    # plain arrays (8 bytes per id) instead of paying for a position map.
+    try:
+        position = ids.index(question_id)
+    except ValueError:
+        return
+    ids[position] = ids[-1]
+    ids.pop()
+
+
+def init_app(app):
+    index = QuestionIndex(
+        app.config.get("QUIZ_INDEX_TTL", QUIZ_INDEX_TTL),
+        app.config.get("QUIZ_DIFFICULTY_SPREAD", QUIZ_DIFFICULTY_SPREAD),
+    )
+    app.extensions["trivia_quiz_index"] = index
+    events.subscribe(app, index.on_changes)
+
+
+def question_index():
+    return current_app.extensions["trivia_quiz_index"]
+
+
+class Excluding:
+    """`excluded` plus the ids already picked in this draw, without copying
+    the caller's set."""
+
+    def __init__(self, excluded, picked):
+        self.excluded = excluded
+        self.picked = picked
+
+    def __contains__(self, question_id):
+        return question_id in self.picked or question_id in self.excluded
+
+    def __len__(self):
+        return len(self.excluded) + len(self.picked)
+
+
+class QuestionDraw:
+    """The draw loop of choose_questions without its row reads, for callers
+    that read rows another way. `ids` holds the next ids to read, None once
+    the draw is done; the rows read for them, formatted and keyed by id, are
+    passed to found(). Ids without a row are dropped from the index."""
+
+    def __init__(self, category, excluded, count=1, difficulty=None):
+        self.index = question_index()
+        self.category = category
+        self.excluded = excluded
+        self.count = count
+        self.difficulty = difficulty
+        self.picked = {}
+        self._draw()
+
+    def _draw(self):
+        self.ids = None
+        if len(self.picked) < self.count:
+            self.ids = (
+                self.index.sample(
+                    self.category,
+                    Excluding(self.excluded, self.picked),
+                    self.count - len(self.picked),
+                    self.difficulty,
+                )
+                or None
+            )
+
+    def found(self, rows):
+        for question_id in self.ids:
+            if question_id in rows:
+                self.picked[question_id] = rows[question_id]
+            else:
+                self.index.remove(question_id)
+        self._draw()
+
+    def questions(self):
+        return list(self.picked.values())
+
+
+def choose_questions(category, excluded, count=1, difficulty=None):
+    """Return up to `count` distinct random questions, formatted, from
+    `category` that are not in `excluded`, read in a single query per draw.
+    With a target `difficulty` the draw is weighted toward it."""
+    draw = QuestionDraw(category, excluded, count, difficulty)
+
+    while draw.ids:
+        draw.found(
+            {
+                row.id: Question.format_row(row)
+                for row in db.session.query(*Question.columns()).filter(
+                    Question.id.in_(draw.ids)
+                )
+            }
+        )
+
+    return draw.questions()
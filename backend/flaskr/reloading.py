@@ -0,0 +1,127 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import threading
+import time
+
+from flask import current_app
+
+from . import events
+
+# ----------------------------------------------------------------------------#
+# Reloading In-Memory State.
+#
+# The category map, question counts, quiz index, search postings, suggestion
+# trie and leaderboards are built from the database, kept current by the
+# write events of this process, and rebuilt once they are older than their
+# TTL to pick up writes made by other workers. Reloadable holds that cycle
+# once: a subclass builds a new state in load() and updates the current one
+# for a batch of write events in apply().
+#
+# The first load runs in the reader that needs it. When `background` is set,
+# later reloads run in a thread while readers keep the old state, and the new
+# one is swapped in as loaded. Events are not replayed onto it: one committed
+# before the load's query is already in it, and applying it again would count
+# it twice. A write that lands while the query runs may be missing until the
+# next reload, as writes from other workers are. A reset drops the state, and
+# any reload that started before it.
+# ----------------------------------------------------------------------------#
+
+
+class Reloadable:
+    # The table whose write events apply() is given.
+    table = None
+    background = False
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.reloads = 0
+        self._state = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._reloading = False
+        self._lock = threading.Condition(threading.RLock())
+
+    def load(self):
+        """Build and return a new state from the database."""
+        raise NotImplementedError
+
+    def apply(self, changes):
+        """Update the current state for `changes`, with the lock held."""
+        raise NotImplementedError
+
+    def _stale(self):
+        return bool(self.ttl) and time.monotonic() - self._loaded_at >= self.ttl
+
+    def _install(self, state):
+        self._state = state
+        self._loaded_at = time.monotonic()
+        self.reloads += 1
+
+    def current(self):
+        """Return the current state, loading it if there is none. A state
+        older than the TTL is reloaded, in a thread for background classes."""
+        state = self._state
+        if state is not None and not self._stale():
+            return state
+        if state is not None and self.background:
+            self.reload_in_background(current_app._get_current_object())
+            return state
+
+        with self._lock:
+            # Wait for a background load that is building the first state.
+            while self._state is None and self._reloading:
+                self._lock.wait()
+            if self._state is None or self._stale():
+                self._install(self.load())
+            return self._state
+
+    def reload_in_background(self, app):
+        """Start a reload in a thread, unless one is running."""
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+            generation = self._generation
+
+        threading.Thread(
+            target=self._reload,
+            args=(app, generation),
+            name="trivia-reload-{}".format(type(self).__name__),
+            daemon=True,
+        ).start()
+
+    def _reload(self, app, generation):
+        state = None
+        try:
+            with app.app_context():
+                state = self.load()
+        except Exception:
+            app.logger.exception("could not reload %s", type(self).__name__)
+
+        with self._lock:
+            self._reloading = False
+            if state is not None and generation == self._generation:
+                self._install(state)
+            elif self._state is not None:
+                # Keep the old state for another TTL rather than retrying on
+                # every read.
+                self._loaded_at = time.monotonic()
+            self._lock.notify_all()
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+            self._generation += 1
+
+    def on_changes(self, changes):
+        changes = [change for change in changes if change.table == self.table]
+        if not changes:
+            return
+
+        with self._lock:
+            if any(change.op == events.RESET for change in changes):
+                self.invalidate()
+                return
+            if self._state is not None:
+                self.apply(changes)
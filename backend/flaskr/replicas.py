@@ -0,0 +1,104 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import itertools
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+
+from models import replica_bind
+from . import events
+
+READ_YOUR_WRITES_WINDOW = 5
+WROTE_COOKIE = "trivia_wrote_at"
+
+# ----------------------------------------------------------------------------#
+# Read Replica Routing.
+#
+# Views marked with @read_replica run their queries on one of the replicas
+# given in DATABASE_REPLICA_URLS, picked round robin. Reads go back to the
+# primary for READ_YOUR_WRITES_WINDOW seconds after a write: for the client
+# that wrote, through a cookie, so it sees its own write from any worker; and
+# for the whole worker, so the in-process caches are not refilled from a
+# replica that has not caught up with the write that invalidated them.
+# ----------------------------------------------------------------------------#
+
+
+class ReplicaRouter:
+    def __init__(self, binds, window=READ_YOUR_WRITES_WINDOW):
+        self.binds = list(binds)
+        self.window = window
+        self.last_write = 0.0
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._next = itertools.cycle(self.binds)
+        self._lock = threading.Lock()
+
+    def on_changes(self, changes):
+        self.last_write = time.time()
+        if has_request_context():
+            g.db_wrote = True
+
+    def choose(self, wrote_at=None):
+        """Return the bind key of the replica to read from, or None for the
+        primary."""
+        now = time.time()
+        recent = max(self.last_write, wrote_at or 0.0)
+
+        if not self.binds or now - recent < self.window:
+            self.primary_reads += 1
+            return None
+
+        with self._lock:
+            self.replica_reads += 1
+            return next(self._next)
+
+
+def replica_urls(value):
+    """Accept a list of URIs or a comma separated string of them."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [url.strip() for url in value if url.strip()]
+
+
+def init_app(app, replicas=()):
+    window = app.config.get("READ_YOUR_WRITES_WINDOW", READ_YOUR_WRITES_WINDOW)
+    router = ReplicaRouter(
+        [replica_bind(number) for number in range(len(replicas))], window
+    )
+    app.extensions["trivia_replicas"] = router
+    events.subscribe(app, router.on_changes)
+
+    @app.after_request
+    def remember_write(response):
+        if g.get("db_wrote") and router.binds:
+            response.set_cookie(
+                WROTE_COOKIE,
+                "{:.3f}".format(time.time()),
+                max_age=math.ceil(window),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+def replica_router():
+    return current_app.extensions["trivia_replicas"]
+
+
+def read_replica(view):
+    """Run the view's queries on a read replica when one is configured."""
+
+    @wraps(view)
+    def route_reads(*args, **kwargs):
+        g.db_replica = replica_router().choose(
+            request.cookies.get(WROTE_COOKIE, None, type=float)
+        )
+        return view(*args, **kwargs)
+
+    return route_reads
@@ -0,0 +1,262 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, make_response, request
+
+from models import Question, Category
+from . import events
+from .compression import (
+    COMPRESS_LEVEL,
+    COMPRESS_MIN_SIZE,
+    compress,
+    encodings,
+    negotiate,
+)
+
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+RESPONSE_CACHE_TTL = 30
+# Stored pages are compressed once per version, so they can afford a higher
+# brotli quality than responses compressed on every request.
+RESPONSE_CACHE_BROTLI_QUALITY = 9
+
+# ----------------------------------------------------------------------------#
+# Rendered Response Cache.
+#
+# Hot listing pages are stored as encoded bytes, compressed once when stored
+# with every encoding flaskr.compression can produce, and keyed by the
+# endpoint, its arguments and the versions of the scopes the page depends on:
+#
+#   /categories              categories
+#   /questions               questions, categories
+#   /questions/<category>    category:<id>, bank
+#
+# A write bumps only the scopes it touches. A question written in category
+# 3 moves "questions" and "category:3", leaving /categories and every other
+# category's pages cached; entries under old versions are simply never read
+# again and age out of the LRU. Scope versions are read before the view runs,
+# so a racing write can only leave newer bytes under an older key.
+#
+# The in-memory versions only see the writes of this worker, so a page is
+# served for at most RESPONSE_CACHE_TTL seconds before it is rendered again
+# to pick up writes made by other workers.
+#
+# Any object with get(key), set(key, value), version(scope) and bump(scope)
+# can be plugged in as RESPONSE_CACHE_BACKEND to share the cache between
+# workers. Its versions must not be evicted.
+# ----------------------------------------------------------------------------#
+
+
+class MemoryBackend:
+    """An LRU of entries bounded by total body size, plus scope versions."""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def version(self, scope):
+        return self._versions.get(scope, 0)
+
+    def bump(self, scope):
+        with self._lock:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedBody:
+    __slots__ = ("body", "encodings", "mimetype", "stored_at")
+
+    def __init__(self, body, mimetype, encodings=None, stored_at=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.encodings = encodings or {}
+        # Wall-clock time, so entries in a shared backend compare across
+        # processes.
+        self.stored_at = time.time() if stored_at is None else stored_at
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(data) for data in self.encodings.values())
+
+    def response(self):
+        response = current_app.response_class(self.body, mimetype=self.mimetype)
+        encoding = negotiate(request.accept_encodings, self.encodings)
+
+        if encoding is not None:
+            response.set_data(self.encodings[encoding])
+            response.headers["Content-Encoding"] = encoding
+
+        if self.encodings:
+            response.vary.add("Accept-Encoding")
+        return response
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        backend,
+        compress_min_size=COMPRESS_MIN_SIZE,
+        compress_level=COMPRESS_LEVEL,
+        brotli_quality=RESPONSE_CACHE_BROTLI_QUALITY,
+        ttl=RESPONSE_CACHE_TTL,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.compress_min_size = compress_min_size
+        self.levels = {"br": brotli_quality, "gzip": compress_level}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, endpoint, view_args, args, scopes):
+        versions = tuple(
+            "{}={}".format(scope, self.backend.version(scope)) for scope in scopes
+        )
+        return "{}|{}|{}|{}".format(
+            endpoint,
+            sorted(view_args.items()),
+            sorted(args.items(multi=True)),
+            ",".join(versions),
+        )
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is not None and self.ttl and time.time() - entry.stored_at >= self.ttl:
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, key, response):
+        body = response.get_data()
+        entry = CachedBody(body, response.mimetype)
+        if self.compress_min_size is not None and len(body) >= self.compress_min_size:
+            for encoding in encodings():
+                entry.encodings[encoding] = compress(
+                    body, encoding, self.levels[encoding]
+                )
+        self.backend.set(key, entry)
+        return entry
+
+    def on_changes(self, changes):
+        scopes = set()
+
+        for change in changes:
+            if change.table == Category.__tablename__:
+                scopes.add("categories")
+            elif change.table != Question.__tablename__:
+                continue
+            elif change.op == events.RESET:
+                scopes.update(("questions", "bank"))
+            else:
+                scopes.add("questions")
+                scopes.add(category_scope(change.row["category"]))
+                if change.previous and "category" in change.previous:
+                    scopes.add(category_scope(change.previous["category"]))
+
+        for scope in scopes:
+            self.backend.bump(scope)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def category_scope(category):
+    return "category:{}".format(category)
+
+
+def init_app(app):
+    if not app.config.get("RESPONSE_CACHE", True):
+        return
+
+    backend = app.config.get("RESPONSE_CACHE_BACKEND")
+    if backend is None:
+        backend = MemoryBackend(
+            app.config.get("RESPONSE_CACHE_MAX_BYTES", RESPONSE_CACHE_MAX_BYTES)
+        )
+
+    # Without their own settings, stored pages are compressed like every
+    # other response, so the compression hook never has to redo one.
+    config = app.config
+    cache = ResponseCache(
+        backend,
+        config.get(
+            "RESPONSE_CACHE_COMPRESS_MIN_SIZE",
+            config.get("COMPRESS_MIN_SIZE", COMPRESS_MIN_SIZE),
+        ),
+        config.get(
+            "RESPONSE_CACHE_COMPRESS_LEVEL",
+            config.get("COMPRESS_LEVEL", COMPRESS_LEVEL),
+        ),
+        config.get("RESPONSE_CACHE_BROTLI_QUALITY", RESPONSE_CACHE_BROTLI_QUALITY),
+        config.get("RESPONSE_CACHE_TTL", RESPONSE_CACHE_TTL),
+    )
+    app.extensions["trivia_response_cache"] = cache
+    events.subscribe(app, cache.on_changes)
+
+
+def response_cache():
+    return current_app.extensions.get("trivia_response_cache")
+
+
+def cached(*scopes):
+    """Serve the view from the response cache. Scope names are formatted
+    with the view arguments, e.g. cached("category:{category_id}", "bank").
+    Cursor requests and non-200 responses are passed through."""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = response_cache()
+            if cache is None or "after" in request.args:
+                return view(*args, **kwargs)
+
+            key = cache.key(
+                request.endpoint,
+                kwargs,
+                request.args,
+                [scope.format(**kwargs) for scope in scopes],
+            )
+            entry = cache.get(key)
+
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = cache.store(key, response)
+
+            return entry.response()
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,280 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import atexit
+import bisect
+import datetime
+import itertools
+import threading
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Score
+from .reloading import Reloadable
+
+SCORE_BUFFER_SIZE = 500
+SCORE_BUFFER_MAX = 50000
+SCORE_FLUSH_INTERVAL = 1.0
+LEADERBOARD_SIZE = 10
+LEADERBOARD_TTL = 300
+PLAYER_MAX_LENGTH = 50
+
+# ----------------------------------------------------------------------------#
+# Score Write Buffer.
+#
+# Submitted scores are appended to an in-process buffer and written to the
+# scores table by a background thread, in one transaction per batch, once
+# SCORE_BUFFER_SIZE scores are waiting or SCORE_FLUSH_INTERVAL seconds have
+# passed, and once more when the interpreter exits. A batch the database
+# rejects is put back and retried with the next flush; past SCORE_BUFFER_MAX
+# waiting scores the oldest are dropped.
+#
+# Score writes are not published to the write event hub: they would bump the
+# data version and the response cache scopes of every question listing.
+# ----------------------------------------------------------------------------#
+
+
+class ScoreBuffer:
+    def __init__(
+        self,
+        app,
+        size=SCORE_BUFFER_SIZE,
+        interval=SCORE_FLUSH_INTERVAL,
+        max_pending=SCORE_BUFFER_MAX,
+    ):
+        self.app = app
+        self.size = size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self.dropped = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        # Held for a whole flush, so a leaderboard reload sees every score
+        # either in the table or in the buffer, never in between.
+        self.flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="trivia-score-buffer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self._flush_at_exit)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self.app.app_context():
+                self.flush()
+
+    def _flush_at_exit(self):
+        with self.app.app_context():
+            self.flush()
+
+    def add(self, row):
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.size
+        self._start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return list(self._pending)
+
+    def flush(self):
+        """Write the waiting scores in one transaction. Returns the number of
+        scores written."""
+        with self.flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+
+            try:
+                db.session.execute(Score.__table__.insert(), rows)
+                db.session.commit()
+            except SQLAlchemyError:
+                db.session.rollback()
+                current_app.logger.exception("could not write %d scores", len(rows))
+                with self._lock:
+                    self._pending[:0] = rows
+                    overflow = len(self._pending) - self.max_pending
+                    if overflow > 0:
+                        del self._pending[:overflow]
+                        self.dropped += overflow
+                self.failures += 1
+                return 0
+
+            self.flushes += 1
+            self.written += len(rows)
+            return len(rows)
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+# ----------------------------------------------------------------------------#
+# Leaderboards.
+#
+# The best LEADERBOARD_SIZE scores of every quiz category are kept in memory
+# as short sorted lists. A submitted score is placed with one bisect into a
+# list of at most k entries, and a leaderboard read copies k entries, so no
+# read touches the scores table. The boards are loaded with one windowed
+# query, together with the scores still in the buffer, and reloaded after
+# LEADERBOARD_TTL seconds to pick up scores recorded by other workers.
+# ----------------------------------------------------------------------------#
+
+
+class Leaderboards(Reloadable):
+    def __init__(self, buffer, size=LEADERBOARD_SIZE, ttl=LEADERBOARD_TTL):
+        super().__init__(ttl)
+        self.buffer = buffer
+        self.size = size
+        self._sequence = itertools.count()
+
+    def load(self):
+        ranked = db.session.query(
+            Score.player,
+            Score.category,
+            Score.score,
+            Score.questions,
+            Score.created_at,
+            func.row_number()
+            .over(
+                partition_by=Score.category,
+                order_by=(Score.score.desc(), Score.created_at, Score.id),
+            )
+            .label("place"),
+        ).subquery()
+
+        with self.buffer.flush_lock:
+            rows = [
+                dict(zip(Score.fields, row[:-1]))
+                for row in db.session.query(ranked).filter(ranked.c.place <= self.size)
+            ]
+            rows.extend(self.buffer.pending())
+
+        boards = {}
+        for row in rows:
+            self._place(boards, row)
+        return boards
+
+    def _place(self, boards, row):
+        """Insert `row` into its board. Returns its 1-based place, or None
+        when it did not make the board."""
+        board = boards.setdefault(row["category"], [])
+        key = (-row["score"], row["created_at"], next(self._sequence))
+
+        if len(board) >= self.size and key >= board[-1][:3]:
+            return None
+
+        place = bisect.bisect_right(board, key)
+        board.insert(place, key + (format_entry(row),))
+        del board[self.size :]
+        return place + 1
+
+    def add(self, row):
+        """Buffer `row` for writing and place it on its board. Both happen
+        under the board lock, so a concurrent reload counts it exactly once."""
+        self.current()
+        with self._lock:
+            self.buffer.add(row)
+            if self._state is None:
+                return None
+            return self._place(self._state, row)
+
+    def top(self, category):
+        boards = self.current()
+        with self._lock:
+            return [entry for *_, entry in boards.get(category, ())]
+
+    def categories(self):
+        boards = self.current()
+        with self._lock:
+            return sorted(boards)
+
+
+def format_entry(row):
+    return {
+        "player": row["player"],
+        "score": row["score"],
+        "questions": row["questions"],
+        "created_at": row["created_at"].isoformat(),
+    }
+
+
+def init_app(app):
+    config = app.config
+    buffer = ScoreBuffer(
+        app,
+        config.get("SCORE_BUFFER_SIZE", SCORE_BUFFER_SIZE),
+        config.get("SCORE_FLUSH_INTERVAL", SCORE_FLUSH_INTERVAL),
+        config.get("SCORE_BUFFER_MAX", SCORE_BUFFER_MAX),
+    )
+    app.extensions["trivia_score_buffer"] = buffer
+    app.extensions["trivia_leaderboards"] = Leaderboards(
+        buffer,
+        config.get("LEADERBOARD_SIZE", LEADERBOARD_SIZE),
+        config.get("LEADERBOARD_TTL", LEADERBOARD_TTL),
+    )
+
+
+def score_buffer():
+    return current_app.extensions["trivia_score_buffer"]
+
+
+def leaderboards():
+    return current_app.extensions["trivia_leaderboards"]
+
+
+def validate_score(body, category):
+    """Return the scores row for a submitted quiz result, or raise
+    ValueError."""
+    player = body.get("player")
+    if not isinstance(player, str) or not player.strip():
+        raise ValueError("player is required")
+    if len(player.strip()) > PLAYER_MAX_LENGTH:
+        raise ValueError(
+            "player must be at most {} characters".format(PLAYER_MAX_LENGTH)
+        )
+
+    try:
+        score = int(body.get("score"))
+        questions = int(body.get("questions"))
+    except (TypeError, ValueError):
+        raise ValueError("score and questions must be integers")
+    if not 0 <= score <= questions or questions < 1:
+        raise ValueError("score must be between 0 and questions")
+
+    return {
+        "player": player.strip(),
+        "category": category,
+        "score": score,
+        "questions": questions,
+        "created_at": datetime.datetime.utcnow(),
+    }
+
+
+def record_score(row):
+    """Buffer a validated score and place it on its leaderboard. Returns the
+    place it took, or None."""
+    return leaderboards().add(row)
@@ -0,0 +1,219 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import math
+import re
+
+import click
+from flask import current_app
+from sqlalchemy import func, literal_column
+
+from models import db, Question
+from . import events
+from .reloading import Reloadable
+
+SEARCH_BACKEND = "auto"
+SEARCH_INDEX_TTL = 300
+SEARCH_CONFIG = "english"
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+# ----------------------------------------------------------------------------#
+# Full-text Search.
+#
+# On Postgres, questions are matched against a GIN-indexed tsvector
+# expression and ranked with ts_rank. The index is built by
+# `flask create-search-index`, not at startup: on a large table the build
+# takes long enough to hold up every worker that starts. Other databases
+# (SQLite in tests and benchmarks) use an in-process inverted index ranked by
+# tf-idf. Both page in the engine and report the true number of matches.
+# ----------------------------------------------------------------------------#
+
+
+class PostgresSearch:
+    index_name = "ix_questions_question_fts"
+
+    def __init__(self, config=SEARCH_CONFIG):
+        self.config = config
+
+    def _vector(self):
+        # The regconfig is inlined, not bound, so the expression matches the
+        # one the GIN index was built on and the planner can use it.
+        config = literal_column("'{}'::regconfig".format(self.config))
+        return func.to_tsvector(config, Question.question), config
+
+    def create_index(self, engine):
+        # CONCURRENTLY builds the index without blocking writes, and can not
+        # run inside a transaction.
+        with engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            connection.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON questions "
+                "USING gin (to_tsvector('{}'::regconfig, question))".format(
+                    self.index_name, self.config
+                )
+            )
+
+    def search(self, term, page, per_page):
+        vector, config = self._vector()
+        query = func.plainto_tsquery(config, term)
+        matches = db.session.query(*Question.columns()).filter(vector.op("@@")(query))
+
+        total = matches.with_entities(func.count(Question.id)).scalar()
+        selection = (
+            matches.order_by(func.ts_rank(vector, query).desc(), Question.id)
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        )
+
+        return [Question.format_row(row) for row in selection], total
+
+
+class _Postings(dict):
+    """{token: {question id: occurrences}}, with the number of documents."""
+
+    __slots__ = ("documents",)
+
+    def __init__(self):
+        super().__init__()
+        self.documents = 0
+
+
+class InvertedIndexSearch(Reloadable):
+    table = Question.__tablename__
+    background = True
+
+    def __init__(self, ttl=SEARCH_INDEX_TTL):
+        super().__init__(ttl)
+
+    def load(self):
+        postings = _Postings()
+        for question_id, text in db.session.query(Question.id, Question.question):
+            _add(postings, question_id, text)
+        return postings
+
+    def apply(self, changes):
+        postings = self._state
+        for change in changes:
+            if change.op == events.INSERT:
+                _add(postings, change.row["id"], change.row["question"])
+            elif change.op == events.DELETE:
+                _remove(postings, change.row["id"], change.row["question"])
+            elif change.op == events.UPDATE and "question" in change.previous:
+                _remove(postings, change.row["id"], change.previous["question"])
+                _add(postings, change.row["id"], change.row["question"])
+
+    def rank(self, term):
+        """Return the ids of questions containing every token of `term`,
+        best match first."""
+        postings = self.current()
+        tokens = set(tokenize(term))
+        lists = [postings.get(token, {}) for token in tokens]
+        if not lists or not all(lists):
+            return []
+
+        lists.sort(key=len)
+        matches = set(lists[0]).intersection(*lists[1:])
+        weights = [math.log(1 + postings.documents / len(counts)) for counts in lists]
+
+        scores = {
+            question_id: sum(
+                counts[question_id] * weight for counts, weight in zip(lists, weights)
+            )
+            for question_id in matches
+        }
+
+        return sorted(
+            scores, key=lambda question_id: (-scores[question_id], question_id)
+        )
+
+    def search(self, term, page, per_page):
+        ranked = self.rank(term)
+        page_ids = ranked[(page - 1) * per_page : page * per_page]
+
+        rows = {
+            row.id: row
+            for row in db.session.query(*Question.columns()).filter(
+                Question.id.in_(page_ids)
+            )
+        }
+
+        return (
+            [
+                Question.format_row(rows[question_id])
+                for question_id in page_ids
+                if question_id in rows
+            ],
+            len(ranked),
+        )
+
+
+def _add(postings, question_id, text):
+    postings.documents += 1
+    for token in tokenize(text):
+        counts = postings.setdefault(token, {})
+        counts[question_id] = counts.get(question_id, 0) + 1
+
+
+def _remove(postings, question_id, text):
+    postings.documents -= 1
+    for token in set(tokenize(text)):
+        counts = postings.get(token)
+        if counts is not None:
+            counts.pop(question_id, None)
+            if not counts:
+                del postings[token]
+
+
+def init_app(app):
+    backend = app.config.get("SEARCH_BACKEND", SEARCH_BACKEND)
+
+    if backend == "auto":
+        with app.app_context():
+            dialect = db.get_engine(app).dialect.name
+        backend = "postgres" if dialect == "postgresql" else "memory"
+
+    if backend == "postgres":
+        engine = PostgresSearch(app.config.get("SEARCH_CONFIG", SEARCH_CONFIG))
+    else:
+        engine = InvertedIndexSearch(
+            app.config.get("SEARCH_INDEX_TTL", SEARCH_INDEX_TTL)
+        )
+        events.subscribe(app, engine.on_changes)
+
+    app.extensions["trivia_search"] = engine
+
+    @app.cli.command("create-search-index")
+    def create_search_index_command():
+        """Build the full-text index used by Postgres search."""
+        postgres = PostgresSearch(app.config.get("SEARCH_CONFIG", SEARCH_CONFIG))
+        if db.engine.dialect.name != "postgresql":
+            raise click.ClickException("only Postgres databases use a search index")
+        postgres.create_index(db.engine)
+        click.echo("{} created.".format(postgres.index_name))
+
+
+def search_engine():
+    return current_app.extensions["trivia_search"]
+
+
+def search_questions(term, page, per_page):
+    """Return one page of questions matching `term` and the total match count.
+    A term without any word characters lists every question."""
+    if not tokenize(term):
+        selection = (
+            db.session.query(*Question.columns())
+            .order_by(Question.id)
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        )
+        total = db.session.query(func.count(Question.id)).scalar()
+        return [Question.format_row(row) for row in selection], total
+
+    return search_engine().search(term, page, per_page)
@@ -0,0 +1,40 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import json
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# ----------------------------------------------------------------------------#
+# JSON Responses.
+#
+# A drop-in for flask.jsonify that encodes with orjson when it is installed
+# and FAST_JSON is not turned off, and with a compact stdlib encoder
+# otherwise. Keys are sorted either way so identical payloads encode to
+# identical bytes.
+# ----------------------------------------------------------------------------#
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS if orjson is not None else 0
+)
+
+
+def dumps(payload):
+    if orjson is not None and current_app.config.get("FAST_JSON", True):
+        return orjson.dumps(payload, option=ORJSON_OPTIONS)
+
+    return json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def jsonify(*args, **kwargs):
+    if args and kwargs:
+        raise TypeError("jsonify() takes either args or kwargs, not both")
+
+    payload = args[0] if len(args) == 1 else (list(args) or kwargs)
+
+    return current_app.response_class(dumps(payload), mimetype="application/json")
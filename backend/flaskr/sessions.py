@@ -0,0 +1,105 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+QUIZ_SESSION_IDLE_TIMEOUT = 30 * 60
+QUIZ_SESSION_MAX = 100000
+
+# ----------------------------------------------------------------------------#
+# Quiz Sessions.
+#
+# A session remembers the category being played, the ids already served and
+# the target difficulty of an adaptive quiz, so clients send a session id
+# instead of the growing previous_questions list and each candidate is
+# checked against a set in O(1).
+#
+# Any object with get(session_id), save(session) and delete(session_id) can
+# be plugged in through the QUIZ_SESSION_STORE config value; the default
+# keeps sessions in process memory.
+# ----------------------------------------------------------------------------#
+
+
+class QuizSession:
+    __slots__ = ("id", "category", "served", "difficulty")
+
+    def __init__(self, category, session_id=None, served=None, difficulty=None):
+        self.id = session_id or secrets.token_urlsafe(16)
+        self.category = category
+        self.served = set(served or ())
+        self.difficulty = difficulty
+
+    def format(self):
+        return {
+            "id": self.id,
+            "category": self.category,
+            "served": len(self.served),
+            "difficulty": self.difficulty,
+        }
+
+
+class MemorySessionStore:
+    """Sessions in an LRU ordered by last use. Sessions idle for longer than
+    `idle_timeout` seconds, and the least recently used ones beyond
+    `max_sessions`, are evicted as new requests come in."""
+
+    def __init__(
+        self, idle_timeout=QUIZ_SESSION_IDLE_TIMEOUT, max_sessions=QUIZ_SESSION_MAX
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, (_, touched_at) = next(iter(self._sessions.items()))
+            if (
+                len(self._sessions) <= self.max_sessions
+                and now - touched_at < self.idle_timeout
+            ):
+                break
+            del self._sessions[session_id]
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], now)
+            return entry[0]
+
+    def save(self, session):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions.pop(session.id, None)
+            self._sessions[session.id] = (session, now)
+            self._evict(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def init_app(app):
+    store = app.config.get("QUIZ_SESSION_STORE")
+    if store is None:
+        store = MemorySessionStore(
+            app.config.get("QUIZ_SESSION_IDLE_TIMEOUT", QUIZ_SESSION_IDLE_TIMEOUT),
+            app.config.get("QUIZ_SESSION_MAX", QUIZ_SESSION_MAX),
+        )
+    app.extensions["trivia_quiz_sessions"] = store
+
+
+def quiz_sessions():
+    return current_app.extensions["trivia_quiz_sessions"]
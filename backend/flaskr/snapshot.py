@@ -0,0 +1,716 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import bisect
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import click
+from flask import abort, current_app, g, request
+from flask_cors import CORS
+
+from models import db, Question, Category
+from .errors import ERROR_MESSAGES
+from .pagination import cursor_arg, encode_cursor, page_args
+from .quiz import (
+    ALL_CATEGORIES,
+    QUIZ_DIFFICULTY_SPREAD,
+    QUIZ_MAX_BATCH,
+    next_difficulty,
+    sample_ids,
+    sample_weighted,
+    start_difficulty,
+)
+from .search import tokenize
+from .serialization import jsonify
+from . import compression, sessions
+from .sessions import QuizSession, quiz_sessions
+
+SNAPSHOT_CHECK_INTERVAL = 1.0
+SNAPSHOT_BATCH_SIZE = 10000
+
+# ----------------------------------------------------------------------------#
+# Question Bank Snapshots.
+#
+# `flask build-snapshot` compiles the questions and categories tables into one
+# read-only file. An app created with SNAPSHOT_PATH set serves the read routes
+# from that file through a memory map and never opens a database connection:
+# workers on the same host share the file's pages through the page cache,
+# and startup only parses a fixed size header.
+#
+# The file is little-endian and laid out as
+#
+#     header       magic, format version, snapshot version, counts, and the
+#                  offset of every section below
+#     strings      UTF-8 text of every question, answer, category type and
+#                  search term, referenced as (offset, length)
+#     questions    one fixed size record per question, ordered by id
+#     categories   one record per category, ordered by id, pointing at its
+#                  run in the category positions
+#     positions    per-category runs of question record numbers (uint32)
+#     cells        one record per (category, difficulty) pair, including
+#                  category 0 for the whole bank, pointing at its own run in
+#                  the positions
+#     terms        one record per search term, ordered by its UTF-8 bytes,
+#                  pointing at its run of postings
+#     postings     (question record number, term frequency) pairs
+#
+# A new snapshot is written next to the old one and renamed over it. Serving
+# workers stat the path at most every SNAPSHOT_CHECK_INTERVAL seconds and
+# map the new file when it changes; requests already holding the old map
+# finish on it.
+# ----------------------------------------------------------------------------#
+
+MAGIC = b"TRIVSNAP"
+FORMAT_VERSION = 2
+NULL = -1
+
+HEADER = struct.Struct("<8sIQIIII7Q")
+QUESTION = struct.Struct("<qIIIIii")
+CATEGORY = struct.Struct("<iIIII")
+CELL = struct.Struct("<iiII")
+TERM = struct.Struct("<IIII")
+POSTING = struct.Struct("<II")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------------#
+# Builder.
+# ----------------------------------------------------------------------------#
+
+
+class _StringTable:
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets = {}
+
+    def add(self, text):
+        encoded = (text or "").encode("utf-8")
+        offset = self._offsets.get(encoded)
+        if offset is None:
+            offset = self._offsets[encoded] = len(self.data)
+            self.data += encoded
+        return offset, len(encoded)
+
+
+def _padded(data):
+    return bytes(data) + b"\0" * (-len(data) % 8)
+
+
+def build_snapshot(path, version=None, batch_size=SNAPSHOT_BATCH_SIZE):
+    """Write the current questions and categories to `path`, atomically.
+    Returns (snapshot version, number of questions)."""
+    version = version or int(time.time() * 1000)
+    strings = _StringTable()
+    questions = bytearray()
+    buckets = OrderedDict()
+    cells = {}
+    postings = {}
+
+    categories = (
+        db.session.query(Category.id, Category.type).order_by(Category.id).all()
+    )
+    for category_id, _ in categories:
+        buckets[category_id] = []
+
+    rows = (
+        db.session.query(*Question.columns())
+        .order_by(Question.id)
+        .execution_options(stream_results=True)
+        .yield_per(batch_size)
+    )
+    for position, (question_id, question, answer, category, difficulty) in enumerate(
+        rows
+    ):
+        questions += QUESTION.pack(
+            question_id,
+            *strings.add(question),
+            *strings.add(answer),
+            NULL if category is None else category,
+            NULL if difficulty is None else difficulty,
+        )
+        cells.setdefault((ALL_CATEGORIES, difficulty), []).append(position)
+        if category in buckets:
+            buckets[category].append(position)
+            cells.setdefault((category, difficulty), []).append(position)
+
+        frequencies = {}
+        for token in tokenize(question):
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, frequency in frequencies.items():
+            postings.setdefault(token, []).append((position, frequency))
+
+    category_records = bytearray()
+    positions = bytearray()
+    for category_id, name in categories:
+        start = len(positions) // 4
+        positions += struct.pack(
+            "<{}I".format(len(buckets[category_id])), *buckets[category_id]
+        )
+        category_records += CATEGORY.pack(
+            category_id, *strings.add(name), start, len(buckets[category_id])
+        )
+
+    cell_records = bytearray()
+    for (category, difficulty), run in sorted(
+        cells.items(), key=lambda item: (item[0][0], item[0][1] or 0)
+    ):
+        start = len(positions) // 4
+        positions += struct.pack("<{}I".format(len(run)), *run)
+        cell_records += CELL.pack(
+            category, NULL if difficulty is None else difficulty, start, len(run)
+        )
+
+    term_records = bytearray()
+    posting_records = bytearray()
+    for token in sorted(postings, key=lambda token: token.encode("utf-8")):
+        start = len(posting_records) // POSTING.size
+        for entry in postings[token]:
+            posting_records += POSTING.pack(*entry)
+        term_records += TERM.pack(*strings.add(token), start, len(postings[token]))
+
+    sections = [
+        strings.data,
+        questions,
+        category_records,
+        positions,
+        cell_records,
+        term_records,
+        posting_records,
+    ]
+
+    offsets = []
+    offset = HEADER.size + (-HEADER.size % 8)
+    for section in sections:
+        offsets.append(offset)
+        offset += len(_padded(section))
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        version,
+        len(questions) // QUESTION.size,
+        len(buckets),
+        len(postings),
+        len(cells),
+        *offsets,
+    )
+
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "wb") as output:
+        output.write(_padded(header))
+        for section in sections:
+            output.write(_padded(section))
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(temporary, path)
+
+    return version, len(questions) // QUESTION.size
+
+
+# ----------------------------------------------------------------------------#
+# Reader.
+# ----------------------------------------------------------------------------#
+
+
+class _Ids:
+    """The question ids of a run of record numbers, as a read-only sequence."""
+
+    def __init__(self, snapshot, positions):
+        self.snapshot = snapshot
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        return self.snapshot.question_id(self.positions[index])
+
+
+class Snapshot:
+    def __init__(self, path):
+        with open(path, "rb") as source:
+            stat = os.fstat(source.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            format_version,
+            self.version,
+            self.question_count,
+            self.category_count,
+            self.term_count,
+            cell_count,
+            strings,
+            questions,
+            categories,
+            positions,
+            cells,
+            terms,
+            postings,
+        ) = HEADER.unpack_from(self._map, 0)
+
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise SnapshotError(
+                "{} is not a version {} trivia snapshot".format(path, FORMAT_VERSION)
+            )
+
+        view = memoryview(self._map)
+        self._strings = strings
+        self._questions = questions
+        self._categories = categories
+        self._positions = view[positions:cells].cast("I")
+        self._terms = terms
+        self._postings = postings
+        self.all = range(self.question_count)
+
+        self.categories = OrderedDict()
+        self._buckets = {}
+        for number in range(self.category_count):
+            category_id, type_offset, type_length, start, count = CATEGORY.unpack_from(
+                self._map, categories + number * CATEGORY.size
+            )
+            self.categories[category_id] = self._string(type_offset, type_length)
+            self._buckets[category_id] = self._positions[start : start + count]
+
+        self._cells = {}
+        for number in range(cell_count):
+            category, difficulty, start, count = CELL.unpack_from(
+                self._map, cells + number * CELL.size
+            )
+            self._cells.setdefault(category, {})[
+                None if difficulty == NULL else difficulty
+            ] = self._positions[start : start + count]
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return self._map[start : start + length].decode("utf-8")
+
+    # Questions.
+
+    def question_id(self, position):
+        return QUESTION.unpack_from(
+            self._map, self._questions + position * QUESTION.size
+        )[0]
+
+    def question(self, position):
+        (
+            question_id,
+            question_offset,
+            question_length,
+            answer_offset,
+            answer_length,
+            category,
+            difficulty,
+        ) = QUESTION.unpack_from(self._map, self._questions + position * QUESTION.size)
+
+        return {
+            "id": question_id,
+            "question": self._string(question_offset, question_length),
+            "answer": self._string(answer_offset, answer_length),
+            "category": None if category == NULL else category,
+            "difficulty": None if difficulty == NULL else difficulty,
+        }
+
+    def bucket(self, category):
+        """Record numbers of the questions in `category`, in id order; all
+        of them for ALL_CATEGORIES."""
+        category = int(category)
+        if category == ALL_CATEGORIES:
+            return self.all
+        return self._buckets.get(category, ())
+
+    def after(self, positions, last_id):
+        """The part of `positions` whose question ids are above `last_id`."""
+        return positions[bisect.bisect_right(_Ids(self, positions), last_id) :]
+
+    def sample(
+        self,
+        category,
+        excluded,
+        count=1,
+        difficulty=None,
+        spread=QUIZ_DIFFICULTY_SPREAD,
+    ):
+        """Draw up to `count` question ids, as quiz.QuestionIndex.sample."""
+        if difficulty is None:
+            return sample_ids(_Ids(self, self.bucket(category)), excluded, count)
+
+        cells = {
+            cell_difficulty: _Ids(self, run)
+            for cell_difficulty, run in self._cells.get(int(category), {}).items()
+        }
+        return sample_weighted(cells, excluded, count, difficulty, spread)
+
+    def by_ids(self, question_ids):
+        positions = {}
+        for question_id in question_ids:
+            position = bisect.bisect_left(_Ids(self, self.all), question_id)
+            if (
+                position < self.question_count
+                and self.question_id(position) == question_id
+            ):
+                positions[question_id] = position
+        return positions
+
+    # Search.
+
+    def _term(self, number):
+        return TERM.unpack_from(self._map, self._terms + number * TERM.size)
+
+    def _find_term(self, token):
+        encoded = token.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length, _, _ = self._term(middle)
+            start = self._strings + offset
+            candidate = self._map[start : start + length]
+            if candidate < encoded:
+                low = middle + 1
+            elif candidate > encoded:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _posting_list(self, token):
+        number = self._find_term(token)
+        if number is None:
+            return {}
+
+        _, _, start, count = self._term(number)
+        return dict(
+            POSTING.iter_unpack(
+                self._map[
+                    self._postings
+                    + start * POSTING.size : self._postings
+                    + (start + count) * POSTING.size
+                ]
+            )
+        )
+
+    def rank(self, term):
+        """Record numbers of the questions containing every token of `term`,
+        ranked by tf-idf as search.InvertedIndexSearch.rank."""
+        lists = [self._posting_list(token) for token in set(tokenize(term))]
+        if not lists or not all(lists):
+            return []
+
+        lists.sort(key=len)
+        matches = set(lists[0]).intersection(*lists[1:])
+        weights = [math.log(1 + self.question_count / len(counts)) for counts in lists]
+
+        scores = {
+            position: sum(
+                counts[position] * weight for counts, weight in zip(lists, weights)
+            )
+            for position in matches
+        }
+
+        return sorted(scores, key=lambda position: (-scores[position], position))
+
+
+class SnapshotHolder:
+    """The snapshot at `path`, re-mapped when the file is replaced."""
+
+    def __init__(self, path, check_interval=SNAPSHOT_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.swaps = 0
+        self._snapshot = Snapshot(path)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def current(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._checked_at = time.monotonic()
+                    self._reload_if_replaced()
+        return self._snapshot
+
+    def _reload_if_replaced(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self._snapshot.identity:
+            return
+
+        try:
+            self._snapshot = Snapshot(self.path)
+            self.swaps += 1
+        except (OSError, ValueError, struct.error, SnapshotError):
+            # A half-copied or foreign file; keep serving the last good one.
+            current_app.logger.exception("could not load snapshot %s", self.path)
+
+
+def init_app(app):
+    @app.cli.command("build-snapshot")
+    @click.argument("path")
+    def build_snapshot_command(path):
+        """Compile questions and categories into a snapshot file."""
+        version, questions = build_snapshot(path)
+        click.echo(
+            "Wrote snapshot {} with {} questions to {}.".format(
+                version, questions, path
+            )
+        )
+
+
+def current_snapshot():
+    """The snapshot this request reads from; fixed for the whole request."""
+    if "snapshot" not in g:
+        g.snapshot = current_app.extensions["trivia_snapshot"].current()
+    return g.snapshot
+
+
+# ----------------------------------------------------------------------------#
+# Snapshot Serving Mode.
+# ----------------------------------------------------------------------------#
+
+
+def _page(positions, snapshot):
+    last_id = cursor_arg(request)
+    page, per_page = page_args(request)
+
+    if last_id is None:
+        selection = positions[(page - 1) * per_page : page * per_page]
+        next_cursor = None
+    else:
+        remaining = snapshot.after(positions, last_id)
+        selection = remaining[:per_page]
+        next_cursor = None
+        if len(remaining) > per_page:
+            next_cursor = encode_cursor(snapshot.question_id(selection[-1]))
+
+    return [snapshot.question(position) for position in selection], next_cursor
+
+
+def serve(app, path):
+    """Register the read-only routes on `app`, answered from the snapshot at
+    `path`. Returns `app`."""
+    app.extensions["trivia_snapshot"] = SnapshotHolder(
+        path, app.config.get("SNAPSHOT_CHECK_INTERVAL", SNAPSHOT_CHECK_INTERVAL)
+    )
+    sessions.init_app(app)
+    compression.init_app(app)
+    CORS(app)
+
+    @app.after_request
+    def tag_snapshot(response):
+        response.headers.add(
+            "Access-Control-Allow-Headers", "Content-Type,Authorization,true"
+        )
+        response.headers.add(
+            "Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS"
+        )
+        if request.method == "GET" and response.status_code == 200:
+            response.set_etag(
+                "snapshot-{}".format(current_snapshot().version), weak=True
+            )
+            response.make_conditional(request)
+        return response
+
+    @app.route("/categories", methods=["GET"])
+    def retrieve_categories():
+        categories = current_snapshot().categories
+
+        if len(categories) == 0:
+            abort(404)
+
+        return jsonify(
+            {
+                "success": True,
+                "categories": categories,
+                "total_categories": len(categories),
+            }
+        )
+
+    @app.route("/questions", methods=["GET"])
+    def retrieve_questions():
+        snapshot = current_snapshot()
+        current_questions, next_cursor = _page(snapshot.all, snapshot)
+
+        if len(current_questions) == 0 or not snapshot.categories:
+            abort(404)
+
+        last_category = next(reversed(snapshot.categories))
+
+        return jsonify(
+            {
+                "success": True,
+                "questions": current_questions,
+                "total_questions": snapshot.question_count,
+                "current_category": snapshot.categories[last_category],
+                "categories": snapshot.categories,
+                "next_cursor": next_cursor,
+            }
+        )
+
+    @app.route("/questions/<int:category_id>", methods=["GET"])
+    def get_categories(category_id):
+        snapshot = current_snapshot()
+        positions = snapshot.bucket(category_id) if category_id else ()
+        current_questions, next_cursor = _page(positions, snapshot)
+
+        if len(current_questions) == 0:
+            abort(404)
+
+        return jsonify(
+            {
+                "success": True,
+                "questions": current_questions,
+                "total_questions": len(positions),
+                "current_category": category_id,
+                "next_cursor": next_cursor,
+            }
+        )
+
+    @app.route("/questions/search", methods=["POST"])
+    def search_question():
+        body = request.get_json(silent=True) or {}
+        search_term = body.get("searchTerm", "") or ""
+        snapshot = current_snapshot()
+        page, per_page = page_args(request)
+
+        ranked = snapshot.rank(search_term) if tokenize(search_term) else snapshot.all
+        current_questions = [
+            snapshot.question(position)
+            for position in ranked[(page - 1) * per_page : page * per_page]
+        ]
+
+        if len(current_questions) == 0:
+            abort(404)
+
+        return jsonify(
+            {
+                "success": True,
+                "questions": current_questions,
+                "total_questions": len(ranked),
+            }
+        )
+
+    @app.route("/quizzes", methods=["POST"])
+    def play_quiz():
+        body = request.get_json(silent=True) or {}
+        snapshot = current_snapshot()
+        session = None
+
+        if body.get("session_id") is not None:
+            session = quiz_sessions().get(body["session_id"])
+
+            if session is None:
+                abort(404)
+
+        try:
+            if session is not None:
+                category, excluded = session.category, session.served
+            else:
+                category = body["quiz_category"]["id"]
+                excluded = set(
+                    int(question_id)
+                    for question_id in body.get("previous_questions", [])
+                )
+
+            count = min(
+                max(int(body.get("count", 1)), 1),
+                app.config.get("QUIZ_MAX_BATCH", QUIZ_MAX_BATCH),
+            )
+            if not snapshot.bucket(category):
+                raise ValueError("empty category")
+            difficulty = next_difficulty(body, session)
+        except (KeyError, TypeError, ValueError):
+            abort(422)
+
+        spread = app.config.get("QUIZ_DIFFICULTY_SPREAD", QUIZ_DIFFICULTY_SPREAD)
+        chosen = snapshot.by_ids(
+            snapshot.sample(category, excluded, count, difficulty, spread)
+        )
+        questions = [snapshot.question(position) for position in chosen.values()]
+
+        if not questions:
+            return jsonify({"question": False, "questions": []})
+
+        if session is not None:
+            session.served.update(question["id"] for question in questions)
+            quiz_sessions().save(session)
+
+        return jsonify(
+            {
+                "success": True,
+                "question": questions[0],
+                "questions": questions,
+                "difficulty": difficulty,
+            }
+        )
+
+    @app.route("/quizzes/sessions", methods=["POST"])
+    def create_quiz_session():
+        body = request.get_json(silent=True) or {}
+        quiz_category = body.get("quiz_category", None)
+
+        try:
+            category = int(quiz_category["id"])
+            if not current_snapshot().bucket(category):
+                raise ValueError("empty category")
+            difficulty = start_difficulty(body)
+        except (KeyError, TypeError, ValueError):
+            abort(422)
+
+        session = QuizSession(category, difficulty=difficulty)
+        quiz_sessions().save(session)
+
+        return jsonify(
+            {"success": True, "session_id": session.id, "session": session.format()}
+        )
+
+    @app.route("/quizzes/sessions/<session_id>", methods=["DELETE"])
+    def delete_quiz_session(session_id):
+        if not quiz_sessions().delete(session_id):
+            abort(404)
+
+        return jsonify({"success": True, "deleted": session_id})
+
+    @app.route("/snapshot", methods=["GET"])
+    def retrieve_snapshot_info():
+        holder = app.extensions["trivia_snapshot"]
+        snapshot = current_snapshot()
+
+        return jsonify(
+            {
+                "success": True,
+                "version": snapshot.version,
+                "questions": snapshot.question_count,
+                "categories": snapshot.category_count,
+                "terms": snapshot.term_count,
+                "swaps": holder.swaps,
+            }
+        )
+
+    def error_handler(code):
+        def handle(error):
+            return (
+                jsonify(
+                    {"success": False, "error": code, "message": ERROR_MESSAGES[code]}
+                ),
+                code,
+            )
+
+        return handle
+
+    for code in ERROR_MESSAGES:
+        app.register_error_handler(code, error_handler(code))
+
+    return app
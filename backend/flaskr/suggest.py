@@ -0,0 +1,150 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import heapq
+
+from flask import current_app
+
+from models import db, Question
+from . import events
+from .reloading import Reloadable
+from .search import tokenize
+
+SUGGEST_INDEX_TTL = 300
+SUGGEST_MAX_RESULTS = 10
+
+# ----------------------------------------------------------------------------#
+# Prefix Suggestions.
+#
+# A trie of the words used in question text, weighted by the number of
+# questions each word appears in. Every node caches its best completions, so
+# a lookup walks the prefix and slices a list without touching the database.
+# Inserts update the caches on their path in place; a delete that removes a
+# cached word clears that cache, and it is rebuilt from the subtree on the
+# next lookup. Numbers are left out: they make poor completions and, in a
+# large bank, most of the trie.
+#
+# Building the trie reads every question, so it is built in a thread when
+# the first request arrives and rebuilt in one after SUGGEST_INDEX_TTL
+# seconds; lookups keep using the old trie meanwhile.
+# ----------------------------------------------------------------------------#
+
+
+class _Node:
+    __slots__ = ("children", "count", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.count = 0
+        self.top = []
+
+
+class SuggestionTrie(Reloadable):
+    table = Question.__tablename__
+    background = True
+
+    def __init__(self, ttl=SUGGEST_INDEX_TTL, max_results=SUGGEST_MAX_RESULTS):
+        super().__init__(ttl)
+        self.max_results = max_results
+
+    def load(self):
+        root = _Node()
+        for (text,) in db.session.query(Question.question):
+            self._add_text(root, text, 1)
+        return root
+
+    def _add_text(self, root, text, delta):
+        for term in set(tokenize(text)):
+            if not term.isdigit():
+                self._add_term(root, term, delta)
+
+    def _add_term(self, root, term, delta):
+        path = [root]
+        for char in term:
+            path.append(path[-1].children.setdefault(char, _Node()))
+
+        leaf = path[-1]
+        leaf.count = max(leaf.count + delta, 0)
+
+        for node in path:
+            if node.top is None:
+                continue
+
+            cached = [entry for entry in node.top if entry[1] != term]
+            if delta < 0 and len(cached) < len(node.top):
+                # The word may drop below one that is not cached here.
+                node.top = None
+            elif leaf.count and (
+                len(cached) < self.max_results or leaf.count > cached[-1][0]
+            ):
+                cached.append((leaf.count, term))
+                cached.sort(key=lambda entry: (-entry[0], entry[1]))
+                node.top = cached[: self.max_results]
+
+        if leaf.count == 0 and not leaf.children:
+            self._prune(term, path)
+
+    def _prune(self, term, path):
+        for depth in range(len(term), 0, -1):
+            node = path[depth]
+            if node.count or node.children:
+                break
+            del path[depth - 1].children[term[depth - 1]]
+
+    def _rebuild(self, node, prefix):
+        entries = []
+        stack = [(node, prefix)]
+        while stack:
+            current, word = stack.pop()
+            if current.count:
+                entries.append((current.count, word))
+            for char, child in current.children.items():
+                stack.append((child, word + char))
+
+        node.top = heapq.nsmallest(
+            self.max_results, entries, key=lambda entry: (-entry[0], entry[1])
+        )
+
+    def suggest(self, prefix, limit=SUGGEST_MAX_RESULTS):
+        node = self.current()
+        prefix = prefix.lower()
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        with self._lock:
+            if node.top is None:
+                self._rebuild(node, prefix)
+            top = node.top
+
+        return [{"term": term, "count": count} for count, term in top[: max(limit, 0)]]
+
+    def apply(self, changes):
+        root = self._state
+        for change in changes:
+            if change.op == events.INSERT:
+                self._add_text(root, change.row["question"], 1)
+            elif change.op == events.DELETE:
+                self._add_text(root, change.row["question"], -1)
+            elif change.op == events.UPDATE and "question" in change.previous:
+                self._add_text(root, change.previous["question"], -1)
+                self._add_text(root, change.row["question"], 1)
+
+
+def init_app(app):
+    trie = SuggestionTrie(
+        app.config.get("SUGGEST_INDEX_TTL", SUGGEST_INDEX_TTL),
+        app.config.get("SUGGEST_MAX_RESULTS", SUGGEST_MAX_RESULTS),
+    )
+    app.extensions["trivia_suggest"] = trie
+    events.subscribe(app, trie.on_changes)
+
+    @app.before_first_request
+    def warm_suggestions():
+        trie.reload_in_background(app)
+
+
+def suggest_terms(prefix, limit):
+    trie = current_app.extensions["trivia_suggest"]
+    return trie.suggest(prefix, min(limit, trie.max_results))
@@ -0,0 +1,107 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import functools
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app, make_response, request
+
+from . import events
+
+DATA_VERSION_MAX_AGE = 60
+
+# ----------------------------------------------------------------------------#
+# Data Version.
+#
+# A counter bumped by every committed question or category write, used as
+# the validator for conditional GETs. The version is read before a view runs,
+# so a write racing with the request can only make the response newer than
+# its ETag, never older.
+#
+# ETags carry a per-process id, so a validator issued by one worker never
+# matches in another. Writes made by other workers are not seen here, so the
+# version also moves on after DATA_VERSION_MAX_AGE seconds, bounding how long
+# a stale 304 can be served.
+# ----------------------------------------------------------------------------#
+
+
+class DataVersion:
+    def __init__(self, max_age=DATA_VERSION_MAX_AGE):
+        self.max_age = max_age
+        self.process_id = secrets.token_hex(4)
+        self.value = 0
+        self.changed_at = time.time()
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+            self.changed_at = time.time()
+            return self.value
+
+    def current(self):
+        """Return (version, last modified time)."""
+        if self.max_age and time.time() - self.changed_at >= self.max_age:
+            self.bump()
+        return self.value, self.changed_at
+
+    def on_changes(self, changes):
+        self.bump()
+
+    def etag(self, version):
+        return "{}-{}".format(self.process_id, version)
+
+
+def init_app(app):
+    version = DataVersion(app.config.get("DATA_VERSION_MAX_AGE", DATA_VERSION_MAX_AGE))
+    app.extensions["trivia_data_version"] = version
+    events.subscribe(app, version.on_changes)
+
+
+def data_version():
+    return current_app.extensions["trivia_data_version"]
+
+
+def conditional(view):
+    """Answer If-None-Match / If-Modified-Since with 304 before the view runs,
+    and tag successful responses with ETag and Last-Modified."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        tracker = data_version()
+        version, changed_at = tracker.current()
+        etag = tracker.etag(version)
+
+        # Last-Modified only has one second resolution. It is left out while
+        # the second of the last change is still running, since a later
+        # write in that same second could not move it forward.
+        last_modified = None
+        if int(time.time()) > int(changed_at):
+            last_modified = datetime.fromtimestamp(int(changed_at), timezone.utc)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = (
+                last_modified is not None
+                and request.if_modified_since is not None
+                and request.if_modified_since >= last_modified
+            )
+
+        if not_modified:
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+
+    return wrapper
@@ -1,27 +1,101 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+from flask import g, has_app_context
+from sqlalchemy import (
+    Column,
+    DateTime,
+    String,
+    Integer,
+    ForeignKey,
+    Index,
+    create_engine,
+    orm,
+)
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
 
 database_name = "trivia"
-database_path = "postgres://{}:{}@{}/{}".format(
-    "postgres", "7749", "localhost:5432", database_name
+database_path = os.environ.get(
+    "DATABASE_URL",
+    "postgres://{}:{}@{}/{}".format(
+        "postgres", "7749", "localhost:5432", database_name
+    ),
 )
 
-db = SQLAlchemy()
+
+"""
+RoutingSession
+    sends the statements of a request marked for a read replica (see
+    flaskr.replicas) to that replica's engine; everything else, and any
+    flush, goes to the primary
+"""
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get("db_replica") if has_app_context() else None
+
+        if replica is not None and not self._flushing:
+            return self.db.get_engine(self.app, bind=replica)
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 
 """
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+
+    pool_size, max_overflow, pool_recycle and pool_pre_ping are passed to
+    every engine (left at SQLAlchemy's defaults when None); each URI in
+    replicas is bound as "replica_<n>" for read-only routes
 """
 
 
-def setup_db(app, database_path=database_path):
+def setup_db(
+    app,
+    database_path=database_path,
+    pool_size=None,
+    max_overflow=None,
+    pool_recycle=None,
+    pool_pre_ping=None,
+    replicas=(),
+):
+    engine_options = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping,
+    }
+    if database_path.startswith("sqlite"):
+        # SQLite engines use NullPool or SingletonThreadPool, which take no
+        # size settings.
+        del engine_options["pool_size"], engine_options["max_overflow"]
+
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        key: value for key, value in engine_options.items() if value is not None
+    }
+    app.config["SQLALCHEMY_BINDS"] = {
+        replica_bind(number): uri for number, uri in enumerate(replicas)
+    }
     db.app = app
     db.init_app(app)
-    db.create_all()
+    db.create_all(bind=None)
+
+
+def replica_bind(number):
+    return "replica_{}".format(number)
 
 
 """
@@ -37,9 +111,18 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(
+        Integer, ForeignKey("categories.id", onupdate="CASCADE", ondelete="SET NULL")
+    )
     difficulty = Column(Integer)
 
+    # Category listings and quiz draws scan a category's questions in id
+    # order, or one difficulty within a category.
+    __table_args__ = (
+        Index("ix_questions_category_id", "category", "id"),
+        Index("ix_questions_category_difficulty", "category", "difficulty"),
+    )
+
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
@@ -66,6 +149,19 @@ class Question(db.Model):
             "difficulty": self.difficulty,
         }
 
+    # Lean read path: select the formatted columns as plain rows, skipping
+    # ORM instances and the identity map, and map each row straight to the
+    # dict format() would build.
+    fields = ("id", "question", "answer", "category", "difficulty")
+
+    @classmethod
+    def columns(cls):
+        return [getattr(cls, field) for field in cls.fields]
+
+    @classmethod
+    def format_row(cls, row):
+        return dict(zip(cls.fields, row))
+
 
 """
 Category
@@ -82,5 +178,49 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
     def format(self):
         return {"id": self.id, "type": self.type}
+
+
+"""
+Score
+    one finished quiz; category 0 is a quiz played across all categories.
+    Rows are written in batches by flaskr.scores, not one commit each
+"""
+
+
+class Score(db.Model):
+    __tablename__ = "scores"
+
+    id = Column(Integer, primary_key=True)
+    player = Column(String, nullable=False)
+    category = Column(Integer, nullable=False)
+    score = Column(Integer, nullable=False)
+    questions = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    # Leaderboards are loaded as the best scores of each category.
+    __table_args__ = (Index("ix_scores_category_score", "category", "score"),)
+
+    fields = ("player", "category", "score", "questions", "created_at")
+
+    def format(self):
+        return {
+            "id": self.id,
+            "player": self.player,
+            "category": self.category,
+            "score": self.score,
+            "questions": self.questions,
+            "created_at": self.created_at.isoformat(),
+        }
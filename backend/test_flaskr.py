@@ -1,10 +1,23 @@
+import gzip
 import os
+import tempfile
+import time
 import unittest
 import json
+from array import array
 from flask_sqlalchemy import SQLAlchemy
 
+try:
+    from starlette.testclient import TestClient
+except ImportError:  # the async serving mode is optional
+    TestClient = None
+
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.asgi import create_asgi_app
+from flaskr.counts import question_counts
+from flaskr.quiz import choose_questions, question_index, sample_ids
+from flaskr.replicas import replica_router
+from models import db, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -12,14 +25,15 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = "trivia_test"
-        self.database_path = "postgres://{}:{}@{}/{}".format(
-            "postgres", "7749", "localhost:5432", self.database_name
+        self.database_path = os.environ.get(
+            "TEST_DATABASE_URL",
+            "postgres://{}:{}@{}/{}".format(
+                "postgres", "7749", "localhost:5432", self.database_name
+            ),
         )
-
-        setup_db(self.app, self.database_path)
+        self.app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+        self.client = self.app.test_client
 
         self.new_question = {
             "question": "Question 8",
@@ -44,14 +58,32 @@ class TriviaTestCase(unittest.TestCase):
     Write at least one test for each test for successful operation and for expected errors.
     
     """
+
+    # GET metrics.
+    def test_get_metrics(self):
+        self.app.config["QUERY_COUNT_HEADER"] = True
+        res = self.client().get("/questions")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(int(res.headers["X-Query-Count"]) > 0)
+
+        res = self.client().get("/metrics")
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(
+            'trivia_request_sql_statements_count{method="GET",route="/questions"}',
+            body,
+        )
+
     # GET Categories.
     def test_get_categories(self):
         res = self.client().get("/categories")
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(data["success"],
-        self.assertTrue(data["total_categories"])True)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["total_categories"])
         self.assertTrue(data["categories"])
 
     def test_get_categories_not_found(self):
@@ -62,7 +94,41 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "Resource Not Found")
 
+    def test_get_category_cache_stats(self):
+        # Without the response cache, every listing reads the category cache.
+        client = create_app(
+            {"SQLALCHEMY_DATABASE_URI": self.database_path, "RESPONSE_CACHE": False}
+        ).test_client()
+        client.get("/categories")
+        client.get("/categories")
+        res = client.get("/categories/cache")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["cache"]["hits"])
+        self.assertTrue(data["cache"]["size"])
+
     #  GET questions.
+    def test_get_category_stats(self):
+        res = self.client().get("/categories/stats")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(
+            data["total_questions"],
+            sum(category["total_questions"] for category in data["categories"].values())
+            + data["uncategorized"],
+        )
+
+        self.client().post("/questions", json=self.new_question)
+        res = self.client().get("/categories/stats")
+
+        self.assertEqual(
+            json.loads(res.data)["total_questions"], data["total_questions"] + 1
+        )
+
     def test_paginated_questions(self):
         res = self.client().get("/questions")
         data = json.loads(res.data)
@@ -72,6 +138,65 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data["questions"])
         self.assertTrue(data["total_questions"])
 
+    def test_304_sent_for_unchanged_questions(self):
+        res = self.client().get("/questions")
+        etag = res.headers["ETag"]
+
+        res = self.client().get("/questions", headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b"")
+
+        self.client().post("/questions", json=self.new_question)
+        res = self.client().get("/questions", headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers["ETag"], etag)
+
+    def test_cached_questions_follow_writes(self):
+        res = self.client().get("/questions")
+        total = json.loads(res.data)["total_questions"]
+
+        self.client().post("/questions", json=self.new_question)
+        res = self.client().get("/questions")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["total_questions"], total + 1)
+
+    def test_cached_questions_expire(self):
+        app = create_app(
+            {"SQLALCHEMY_DATABASE_URI": self.database_path, "RESPONSE_CACHE_TTL": 0.05}
+        )
+        client = app.test_client()
+        cache = app.extensions["trivia_response_cache"]
+
+        client.get("/questions")
+        client.get("/questions")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+        time.sleep(0.1)
+        client.get("/questions")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 2})
+
+    def test_questions_gzip_compressed(self):
+        res = self.client().get(
+            "/questions?per_page=20", headers={"Accept-Encoding": "gzip"}
+        )
+        data = json.loads(gzip.decompress(res.data))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", res.headers["Vary"])
+        self.assertEqual(data["success"], True)
+
+        res = self.client().get(
+            "/questions?per_page=20", headers={"Accept-Encoding": "identity"}
+        )
+
+        self.assertNotIn("Content-Encoding", res.headers)
+        self.assertEqual(json.loads(res.data), data)
+
     def test_404_sent_requesting_beyond_valid_page(self):
         res = self.client().get("/questions?page=1000", json={"category": 1})
         data = json.loads(res.data)
@@ -80,6 +205,29 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "Resource Not Found")
 
+    def test_cursor_paginated_questions(self):
+        res = self.client().get("/questions?after=&per_page=5")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(len(data["questions"]), 5)
+        self.assertTrue(data["next_cursor"])
+
+        res = self.client().get("/questions?per_page=5&after=" + data["next_cursor"])
+        next_data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(next_data["questions"][0]["id"], data["questions"][-1]["id"])
+
+    def test_400_sent_with_malformed_cursor(self):
+        res = self.client().get("/questions?after=not-a-cursor")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "Bad Request")
+
     # # DELETE with question_id.
 
     def test_delete_questions(self):
@@ -116,6 +264,40 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data["questions"])
         self.assertTrue(data["total_questions"])
 
+    def test_post_new_question_unknown_category_422(self):
+        res = self.client().post(
+            "/questions", json=dict(self.new_question, category="Unknown")
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
+    def test_changes_since_version(self):
+        res = self.client().get("/changes?since=")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["resync"], True)
+        version = data["version"]
+
+        res = self.client().post("/questions", json=self.new_question)
+        question_id = json.loads(res.data)["created"]
+        self.client().delete("/questions/{}".format(question_id))
+
+        res = self.client().get("/changes?since=" + version)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["resync"], False)
+        self.assertEqual(
+            [(change["op"], change["table"]) for change in data["changes"]],
+            [("insert", "questions"), ("delete", "questions")],
+        )
+        self.assertEqual(data["changes"][0]["row"]["id"], question_id)
+        self.assertEqual(data["changes"][1]["id"], question_id)
+        self.assertEqual(data["version"], data["changes"][1]["version"])
+
     def test_post_new_question_405(self):
         res = self.client().post("/questions/100", json=self.new_question)
         data = json.loads(res.data)
@@ -124,6 +306,193 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "Method Not Allowed")
 
+    def test_batch_create_and_delete_questions(self):
+        res = self.client().post(
+            "/questions/batch",
+            json={"questions": [self.new_question, {"question": "No answer"}]},
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(len(data["created"]), 1)
+        self.assertEqual(data["failed"], 1)
+        self.assertEqual(data["results"][1]["success"], False)
+
+        res = self.client().delete(
+            "/questions/batch", json={"ids": data["created"] + [1000000]}
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data["deleted"]), 1)
+        self.assertEqual(data["results"][1]["error"], "question not found")
+
+    def test_batch_questions_422_without_items(self):
+        res = self.client().delete("/questions/batch", json={"ids": []})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
+    def test_import_questions(self):
+        rows = "\n".join(
+            [
+                json.dumps(
+                    {
+                        "question": "Imported question",
+                        "answer": "Imported answer",
+                        "category": 1,
+                        "difficulty": 2,
+                    }
+                ),
+                json.dumps({"question": "", "answer": "x", "category": 1}),
+            ]
+        )
+        res = self.client().post(
+            "/questions/import", data=rows, content_type="application/x-ndjson"
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual(data["failed"], 1)
+        self.assertEqual(data["errors"][0]["row"], 2)
+
+    def test_import_questions_reports_unreadable_rows(self):
+        rows = b"\n".join(
+            [
+                b"question,answer,category,difficulty",
+                b"Imported CSV question,Imported answer,1,2",
+                b"Bad \xff bytes,Imported answer,1,2",
+                b"Too many,fields,1,2,3",
+            ]
+        )
+        res = self.client().post(
+            "/questions/import", data=rows, content_type="text/csv"
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual(data["failed"], 2)
+        self.assertEqual([error["row"] for error in data["errors"]], [2, 3])
+
+    def test_export_questions(self):
+        res = self.client().get("/questions/export?category=4")
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        self.assertTrue(rows)
+        self.assertTrue(all(str(row["category"]) == "4" for row in rows))
+
+    def test_serve_questions_from_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trivia.snap")
+            result = self.app.test_cli_runner().invoke(args=["build-snapshot", path])
+            self.assertEqual(result.exit_code, 0)
+
+            snapshot_client = create_app({"SNAPSHOT_PATH": path}).test_client()
+
+            for url in ("/categories", "/questions?page=1", "/questions/4"):
+                res = snapshot_client.get(url)
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(
+                    json.loads(res.data), json.loads(self.client().get(url).data)
+                )
+
+            res = snapshot_client.post(
+                "/quizzes", json={"quiz_category": {"id": 4}, "previous_questions": []}
+            )
+            self.assertEqual(json.loads(res.data)["question"]["category"], 4)
+
+    def test_read_from_replica_until_a_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            urls = {
+                name: "sqlite:///" + os.path.join(directory, name + ".db")
+                for name in ("primary", "replica")
+            }
+            for name, url in urls.items():
+                app = create_app({"SQLALCHEMY_DATABASE_URI": url})
+                with app.app_context():
+                    db.create_all()
+                    db.session.add(Category("Science"))
+                    db.session.add(Question("From the " + name, "Yes", 1, 1))
+                    db.session.commit()
+
+            app = create_app(
+                {
+                    "SQLALCHEMY_DATABASE_URI": urls["primary"],
+                    "DATABASE_REPLICA_URLS": urls["replica"],
+                    "RESPONSE_CACHE": False,
+                }
+            )
+            client = app.test_client()
+
+            def listed():
+                data = json.loads(client.get("/questions").data)
+                return [question["question"] for question in data["questions"]]
+
+            self.assertEqual(listed(), ["From the replica"])
+
+            res = client.post("/questions", json=dict(self.new_question, category=1))
+            self.assertEqual(res.status_code, 200)
+            self.assertIn("trivia_wrote_at", res.headers["Set-Cookie"])
+
+            # Within READ_YOUR_WRITES_WINDOW of the write, reads stay on the
+            # primary.
+            self.assertEqual(listed(), ["From the primary", "Question 8"])
+
+            # The cookie alone keeps the writer on the primary; other clients
+            # go back to the replica.
+            with app.app_context():
+                replica_router().last_write = 0.0
+            self.assertEqual(listed(), ["From the primary", "Question 8"])
+
+            client = app.test_client()
+            self.assertEqual(listed(), ["From the replica"])
+
+    @unittest.skipIf(TestClient is None, "starlette is not installed")
+    def test_asgi_app_matches_flask_app(self):
+        asgi_app = create_asgi_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+
+        with TestClient(asgi_app) as asgi_client:
+            for url in (
+                "/categories",
+                "/questions",
+                "/questions?page=2",
+                "/questions?after=&per_page=5",
+                "/questions/4",
+                "/questions?page=1000",
+            ):
+                res = self.client().get(url)
+                asgi_res = asgi_client.get(url)
+
+                self.assertEqual(asgi_res.status_code, res.status_code, url)
+                self.assertEqual(asgi_res.json(), json.loads(res.data), url)
+
+            # Draws are random, so compare a draw of the whole category.
+            quiz = {"quiz_category": {"id": 4}, "previous_questions": [], "count": 20}
+            res = self.client().post("/quizzes", json=quiz)
+            asgi_res = asgi_client.post("/quizzes", json=quiz)
+            data, asgi_data = json.loads(res.data), asgi_res.json()
+
+            self.assertEqual(asgi_res.status_code, res.status_code)
+            self.assertEqual(
+                sorted(asgi_data["questions"], key=lambda question: question["id"]),
+                sorted(data["questions"], key=lambda question: question["id"]),
+            )
+            self.assertEqual(asgi_data["difficulty"], data["difficulty"])
+
+            quiz = {"quiz_category": {"id": 1000}, "previous_questions": []}
+            res = self.client().post("/quizzes", json=quiz)
+            asgi_res = asgi_client.post("/quizzes", json=quiz)
+
+            self.assertEqual(asgi_res.status_code, res.status_code)
+            self.assertEqual(asgi_res.json(), json.loads(res.data))
+
     # # Search question with search term.
 
     def test_search_questions(self):
@@ -132,6 +501,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data["success"], True)
 
+    def test_search_questions_ranked_and_counted(self):
+        texts = [
+            "Which wind is a zephyr?",
+            "Zephyr, zephyr: which zephyr is the west wind?",
+            "Which train was called the Zephyr?",
+        ]
+        res = self.client().post(
+            "/questions/batch",
+            json={
+                "questions": [dict(self.new_question, question=text) for text in texts]
+            },
+        )
+        created = json.loads(res.data)["created"]
+
+        res = self.client().post(
+            "/questions/search?per_page=2", json={"searchTerm": "zephyr"}
+        )
+        data = json.loads(res.data)
+
+        self.client().delete("/questions/batch", json={"ids": created})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data["questions"]), 2)
+        self.assertGreater(data["total_questions"], 2)
+        self.assertEqual(data["questions"][0]["id"], created[1])
+
     def test_search_questions_404(self):
         res = self.client().post("/questions/search", json={"search": "1"})
         data = json.loads(res.data)
@@ -139,6 +534,24 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "Resource Not Found")
 
+    def test_suggest_terms(self):
+        res = self.client().get("/questions/suggest?prefix=wh&limit=3")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["suggestions"])
+        self.assertLessEqual(len(data["suggestions"]), 3)
+        for suggestion in data["suggestions"]:
+            self.assertTrue(suggestion["term"].startswith("wh"))
+
+    def test_suggest_terms_skip_numbers(self):
+        res = self.client().get("/questions/suggest?prefix=19")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["suggestions"], [])
+
     # # GET questions with category_id.
 
     def test_questions_with_category_id(self):
@@ -173,8 +586,7 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data["success"], True)
-
-    self.assertTrue(data["question"])
+        self.assertTrue(data["question"])
 
     def test_play_quiz_if_not_quiz(self):
         res = self.client().post(
@@ -193,7 +605,246 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "Unprocessable")
 
+    def test_play_quiz_without_body(self):
+        res = self.client().post("/quizzes")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
+        res = self.client().post("/quizzes", json=[])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
+        res = self.client().post("/quizzes", json=["not", "an", "object"])
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_play_quiz_with_session(self):
+        res = self.client().post(
+            "/quizzes/sessions",
+            json={"quiz_category": {"type": "History", "id": 4}},
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data["session_id"])
+        self.assertIsNone(data["session"]["difficulty"])
+
+        session_id = data["session_id"]
+        served = set()
+        for _ in range(2):
+            res = self.client().post("/quizzes", json={"session_id": session_id})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn(data["question"]["id"], served)
+            served.add(data["question"]["id"])
+
+        res = self.client().delete("/quizzes/sessions/" + session_id)
+        self.assertEqual(res.status_code, 200)
+
+    def test_post_score_with_session(self):
+        res = self.client().post(
+            "/quizzes/sessions",
+            json={"quiz_category": {"type": "Science", "id": "1"}},
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["session"]["category"], 1)
+
+        res = self.client().post(
+            "/scores",
+            json={
+                "session_id": data["session_id"],
+                "player": "Ada",
+                "score": 1,
+                "questions": 2,
+            },
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["category"], 1)
+
+    def test_create_quiz_session_without_body(self):
+        res = self.client().post("/quizzes/sessions")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
+    def test_play_quiz_batch(self):
+        res = self.client().post(
+            "/quizzes",
+            json={
+                "previous_questions": [],
+                "quiz_category": {"type": "All", "id": 0},
+                "count": 5,
+            },
+        )
+        data = json.loads(res.data)
+        ids = [question["id"] for question in data["questions"]]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(data["question"]["id"], ids[0])
+
+    def test_play_quiz_adaptive_difficulty(self):
+        res = self.client().post(
+            "/quizzes/sessions",
+            json={"quiz_category": {"type": "All", "id": 0}, "difficulty": 2},
+        )
+        session_id = json.loads(res.data)["session_id"]
+
+        res = self.client().post(
+            "/quizzes", json={"session_id": session_id, "correct": True}
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["difficulty"], 2.5)
+
+        res = self.client().post(
+            "/quizzes", json={"session_id": session_id, "correct": False}
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["difficulty"], 2.0)
+
+    def test_play_quiz_with_unknown_session(self):
+        res = self.client().post("/quizzes", json={"session_id": "missing"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+
+    def test_sample_ids_skips_excluded(self):
+        ids = array("q", range(1, 101))
+        excluded = set(range(1, 11))
+        chosen = sample_ids(ids, excluded, 20)
+
+        self.assertEqual(len(chosen), 20)
+        self.assertEqual(len(set(chosen)), 20)
+        self.assertFalse(excluded & set(chosen))
+
+    def test_sample_ids_with_dense_exclusion(self):
+        ids = array("q", range(1, 101))
+
+        self.assertEqual(sorted(sample_ids(ids, set(range(1, 98)), 5)), [98, 99, 100])
+        self.assertEqual(sample_ids(ids, set(ids), 1), [])
+
+    def test_choose_questions_drops_deleted_ids(self):
+        with self.app.app_context():
+            index = question_index()
+            self.assertEqual(list(index.bucket(10**6)), [])
+
+            # An id whose row has gone, alone in its category.
+            index.add(10**9, 10**6)
+            self.assertEqual(choose_questions(10**6, set()), [])
+            self.assertNotIn(10**9, index.bucket(10**6))
+            self.assertNotIn(10**9, index.bucket(None))
+
+    def test_quiz_index_reloads_in_background(self):
+        with self.app.app_context():
+            index = question_index()
+            ids = index.bucket(None)
+            reloads = index.reloads
+
+            index._loaded_at = 0.0
+            self.assertIs(index.bucket(None), ids)
+
+            for _ in range(500):
+                if index.reloads > reloads:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(index.reloads, reloads + 1)
+            self.assertEqual(sorted(index.bucket(None)), sorted(ids))
+
+    def test_background_reload_counts_concurrent_insert_once(self):
+        with self.app.app_context():
+            counts = question_counts()
+            counts.total()
+            reloads = counts.reloads
+            load = counts.load
+            added = []
+
+            def insert_then_load():
+                # Committed while the reload runs, before its query.
+                question = Question("Mid-reload?", "Yes", 1, 1)
+                question.insert()
+                added.append(question.id)
+                return load()
+
+            counts.load = insert_then_load
+            counts._loaded_at = 0.0
+            try:
+                counts.total()
+                for _ in range(500):
+                    if counts.reloads > reloads:
+                        break
+                    time.sleep(0.01)
+            finally:
+                del counts.load
+
+            self.assertEqual(counts.reloads, reloads + 1)
+            self.assertEqual(counts.total(), Question.query.count())
+            Question.query.get(added[0]).delete()
+
+    def test_post_score_and_leaderboard(self):
+        # A score above every earlier run's, so it tops the board each time.
+        score = int(time.time() * 1000)
+        res = self.client().post(
+            "/scores",
+            json={
+                "player": "Ada",
+                "quiz_category": {"type": "Science", "id": 1},
+                "score": score,
+                "questions": score,
+            },
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["place"], 1)
+
+        res = self.client().get("/leaderboards/1")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["leaderboard"][0]["player"], "Ada")
+        self.assertEqual(data["leaderboard"][0]["score"], score)
+
+    def test_post_score_without_body(self):
+        res = self.client().post("/scores")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
+    def test_post_score_more_than_questions_422(self):
+        res = self.client().post(
+            "/scores",
+            json={
+                "player": "Ada",
+                "quiz_category": {"type": "Science", "id": 1},
+                "score": 6,
+                "questions": 5,
+            },
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -13,12 +13,100 @@ class QuestionView extends Component {
       page: 1,
       totalQuestions: 0,
       categories: {},
+      categoryTotals: {},
       currentCategory: null,
+      listing: {category: null},
     }
   }
 
   componentDidMount() {
     this.getQuestions();
+    this.getCategoryTotals();
+    this.followChanges();
+  }
+
+  componentWillUnmount() {
+    if(this.changes) { this.changes.close() }
+  }
+
+  followChanges = () => {
+    if(!window.EventSource) { return; }
+    this.changes = new EventSource('/changes')
+    this.changes.onmessage = (event) => this.applyChange(JSON.parse(event.data))
+    this.changes.addEventListener('resync', () => {
+      this.refreshListing();
+      this.getCategoryTotals();
+    })
+  }
+
+  applyChange = (change) => {
+    if(change.table !== 'questions') { return; }
+
+    const categoryTotals = {...this.state.categoryTotals}
+    if(change.op === 'insert') {
+      categoryTotals[change.row.category] = (categoryTotals[change.row.category] || 0) + 1
+      this.setState({
+        categoryTotals,
+        totalQuestions: this.state.totalQuestions + (this.inListing(change.row.category) ? 1 : 0)
+      })
+    } else if(change.op === 'update') {
+      this.setState({
+        questions: this.state.questions.map(q => q.id === change.row.id ? change.row : q)
+      })
+    } else if(change.op === 'delete') {
+      categoryTotals[change.category] = Math.max((categoryTotals[change.category] || 0) - 1, 0)
+      this.setState({categoryTotals})
+
+      // Re-fetch the listing, so later questions move up into the page and
+      // the paginator follows the new total. Step back a page if the delete
+      // emptied the last one.
+      if(!this.inListing(change.category) && !this.state.questions.some(q => q.id === change.id)) {
+        return;
+      }
+      if(this.state.listing.category === null) {
+        const lastPage = Math.max(Math.ceil((this.state.totalQuestions - 1) / 10), 1)
+        this.setState({page: Math.min(this.state.page, lastPage)}, this.refreshListing)
+      } else {
+        this.refreshListing()
+      }
+    }
+  }
+
+  // Whether a question in `category` belongs to the listing on screen. Search
+  // results can not be told from the change alone.
+  inListing = (category) => {
+    const listing = this.state.listing
+    return !('search' in listing) &&
+      (listing.category === null || String(listing.category) === String(category))
+  }
+
+  refreshListing = () => {
+    const listing = this.state.listing
+    if('search' in listing) {
+      this.submitSearch(listing.search)
+    } else if(listing.category === null) {
+      this.getQuestions()
+    } else {
+      this.getByCategory(listing.category)
+    }
+  }
+
+  getCategoryTotals = () => {
+    $.ajax({
+      url: `/categories/stats`,
+      type: "GET",
+      success: (result) => {
+        const categoryTotals = {}
+        Object.keys(result.categories).forEach((id) => {
+          categoryTotals[id] = result.categories[id].total_questions
+        })
+        this.setState({categoryTotals})
+        return;
+      },
+      error: (error) => {
+        return;
+      }
+    })
   }
 
   getQuestions = () => {
@@ -30,8 +118,8 @@ class QuestionView extends Component {
           questions: result.questions,
           totalQuestions: result.total_questions,
           categories: result.categories,
-          currentCategory: result.current_category
-          
+          currentCategory: result.current_category,
+          listing: {category: null}
          })
         return;
       },
@@ -68,8 +156,8 @@ class QuestionView extends Component {
         this.setState({
          questions: result.questions,
           totalQuestions: result.total_questions,
-          currentCategory: result.current_category
-         
+          currentCategory: result.current_category,
+          listing: {category: category_id}
          })
         return;
       },
@@ -95,7 +183,8 @@ class QuestionView extends Component {
         this.setState({
           questions: result.questions,
           totalQuestions: result.total_questions,
-          currentCategory: result.current_category
+          currentCategory: result.current_category,
+          listing: {search: searchTerm}
         })
         return;
       },
@@ -113,7 +202,10 @@ class QuestionView extends Component {
           url: `/questions/${question_id}`, //TODO: update request URL
           type: "DELETE",
           success: (result) => {
-            this.getQuestions();
+            // The change feed re-fetches the listing; without it, do it here.
+            if(!this.changes || this.changes.readyState !== EventSource.OPEN) {
+              this.refreshListing();
+            }
           },
           error: (error) => {
             alert('Unable to load questions. Please try your request again')
@@ -133,6 +225,7 @@ class QuestionView extends Component {
             {Object.keys(this.state.categories).map((id, ) => (
               <li key={id} onClick={() => {this.getByCategory(id)}}>
                 {this.state.categories[id]}
+                {id in this.state.categoryTotals ? ` (${this.state.categoryTotals[id]})` : ''}
                 <img className="category" src={`${this.state.categories[id]}.svg`}/>
               </li>
             ))}
@@ -10,13 +10,18 @@ class QuizView extends Component {
     super();
     this.state = {
         quizCategory: null,
+        sessionId: null,
         previousQuestions: [], 
+        upcomingQuestions: [],
         showAnswer: false,
         categories: {},
         numCorrect: 0,
         currentQuestion: {},
         guess: '',
-        forceEnd: false
+        forceEnd: false,
+        player: '',
+        scoreSaved: false,
+        leaderboard: []
     }
   }
 
@@ -36,7 +41,27 @@ class QuizView extends Component {
   }
 
   selectCategory = ({type, id=0}) => {
-    this.setState({quizCategory: {type, id}}, this.getNextQuestion)
+    $.ajax({
+      url: '/quizzes/sessions',
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        quiz_category: {type, id}
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState({quizCategory: {type, id}, sessionId: result.session_id}, this.getNextQuestion)
+        return;
+      },
+      error: (error) => {
+        alert('Unable to start the quiz. Please try your request again')
+        return;
+      }
+    })
   }
 
   handleChange = (event) => {
@@ -47,14 +72,32 @@ class QuizView extends Component {
     const previousQuestions = [...this.state.previousQuestions]
     if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
 
+    if(previousQuestions.length === questionsPerPlay) {
+      this.setState({previousQuestions: previousQuestions})
+      return;
+    }
+
+    if(this.state.upcomingQuestions.length) {
+      const [nextQuestion, ...upcomingQuestions] = this.state.upcomingQuestions
+      this.setState({
+        showAnswer: false,
+        previousQuestions: previousQuestions,
+        upcomingQuestions: upcomingQuestions,
+        currentQuestion: nextQuestion,
+        guess: '',
+        forceEnd: false
+      })
+      return;
+    }
+
     $.ajax({
       url: '/quizzes', //TODO: update request URL
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
       data: JSON.stringify({
-        previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory
+        session_id: this.state.sessionId,
+        count: questionsPerPlay - previousQuestions.length
       }),
       xhrFields: {
         withCredentials: true
@@ -64,6 +107,7 @@ class QuizView extends Component {
         this.setState({
           showAnswer: false,
           previousQuestions: previousQuestions,
+          upcomingQuestions: (result.questions || []).slice(1),
           currentQuestion: result.question,
           guess: '',
           forceEnd: result.question ? false : true
@@ -88,14 +132,64 @@ class QuizView extends Component {
   }
 
   restartGame = () => {
+    if(this.state.sessionId) {
+      $.ajax({url: `/quizzes/sessions/${this.state.sessionId}`, type: "DELETE"})
+    }
     this.setState({
       quizCategory: null,
+      sessionId: null,
       previousQuestions: [], 
+      upcomingQuestions: [],
       showAnswer: false,
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
-      forceEnd: false
+      forceEnd: false,
+      scoreSaved: false,
+      leaderboard: []
+    })
+  }
+
+  submitScore = (event) => {
+    event.preventDefault();
+    $.ajax({
+      url: '/scores',
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        session_id: this.state.sessionId,
+        player: this.state.player,
+        score: this.state.numCorrect,
+        questions: this.state.previousQuestions.length
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState({scoreSaved: true}, () => this.getLeaderboard(result.category))
+        return;
+      },
+      error: (error) => {
+        alert('Unable to save your score. Please try your request again')
+        return;
+      }
+    })
+  }
+
+  getLeaderboard = (category) => {
+    $.ajax({
+      url: `/leaderboards/${category}`,
+      type: "GET",
+      success: (result) => {
+        this.setState({leaderboard: result.leaderboard})
+        return;
+      },
+      error: (error) => {
+        alert('Unable to load the leaderboard. Please try your request again')
+        return;
+      }
     })
   }
 
@@ -125,6 +219,19 @@ class QuizView extends Component {
     return(
       <div className="quiz-play-holder">
         <div className="final-header"> Your Final Score is {this.state.numCorrect}</div>
+        {!this.state.scoreSaved && this.state.previousQuestions.length > 0 && (
+          <form onSubmit={this.submitScore}>
+            <input type="text" name="player" placeholder="Your name" onChange={this.handleChange}/>
+            <input className="button" type="submit" value="Save Score" />
+          </form>
+        )}
+        {this.state.leaderboard.length > 0 && (
+          <ol className="leaderboard">
+            {this.state.leaderboard.map((entry, place) => (
+              <li key={place}>{entry.player}: {entry.score}/{entry.questions}</li>
+            ))}
+          </ol>
+        )}
         <div className="play-again button" onClick={this.restartGame}> Play Again? </div>
       </div>
     )
@@ -1,8 +1,10 @@
 import React, { Component } from 'react'
+import $ from 'jquery';
 
 class Search extends Component {
   state = {
     query: '',
+    suggestions: [],
   }
 
   getInfo = (event) => {
@@ -13,6 +15,31 @@ class Search extends Component {
   handleInputChange = () => {
     this.setState({
       query: this.search.value
+    }, this.getSuggestions)
+  }
+
+  getSuggestions = () => {
+    const words = this.state.query.split(' ')
+    const prefix = words[words.length - 1]
+    if(!prefix) {
+      this.setState({suggestions: []})
+      return;
+    }
+
+    $.ajax({
+      url: `/questions/suggest?prefix=${encodeURIComponent(prefix)}&limit=5`,
+      type: "GET",
+      success: (result) => {
+        const head = words.slice(0, -1).join(' ')
+        this.setState({
+          suggestions: result.suggestions.map(({term}) => head ? `${head} ${term}` : term)
+        })
+        return;
+      },
+      error: (error) => {
+        this.setState({suggestions: []})
+        return;
+      }
     })
   }
 
@@ -23,7 +50,13 @@ class Search extends Component {
           placeholder="Search questions..."
           ref={input => this.search = input}
           onChange={this.handleInputChange}
+          list="search-suggestions"
         />
+        <datalist id="search-suggestions">
+          {this.state.suggestions.map(suggestion => (
+            <option key={suggestion} value={suggestion} />
+          ))}
+        </datalist>
         <input type="submit" value="Submit" className="button"/>
       </form>
     )